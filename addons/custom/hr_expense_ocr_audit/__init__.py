@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 
+from . import services
 from . import models
 from . import controllers
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'HR Expense OCR Integration',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.3.0',
     'category': 'Human Resources/Expenses',
     'summary': 'Receipt/Invoice OCR processing with PaddleOCR',
     'description': """
@@ -12,9 +12,12 @@ Automated receipt and invoice processing using PaddleOCR:
 
 Features:
 - Automatic OCR processing on image attachment
+- Asynchronous, batched OCR via queue_job (uploads return immediately)
 - Confidence-based review workflow (>85% auto-approved)
 - Manual "Process with OCR" button
+- Bulk receipt import (many files or a ZIP) with progress tracking
 - Review queue dashboard for low-confidence results
+- Duplicate receipt detection (perceptual image hash + field fingerprint)
 - Field extraction: merchant, amount, date, tax, currency
 
 Technical Stack:
@@ -30,9 +33,11 @@ Technical Stack:
         'base',
         'hr_expense',
         'mail',
+        'queue_job',
     ],
     'data': [
         'data/sequence.xml',
+        'data/queue_job_data.xml',
         'security/ir.model.access.csv',
         'views/expense_views.xml',
         'views/expense_ocr_views.xml',
@@ -1,22 +1,53 @@
 # -*- coding: utf-8 -*-
 
-import base64
 import json
 import logging
+import os
+import zipfile
+from contextlib import ExitStack
 
 from odoo import http
 from odoo.http import request
 
 _logger = logging.getLogger(__name__)
 
+# Largest receipt accepted (hr_expense_ocr.max_upload_mb overrides)
+DEFAULT_MAX_UPLOAD_MB = 20
+
+# Room for multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Receipts accepted by one bulk import (hr_expense_ocr.bulk_max_files overrides)
+DEFAULT_BULK_MAX_FILES = 500
+
+# Bulk imports write attachments this many at a time, so only one chunk
+# of images is held in memory
+ATTACHMENT_CHUNK = 50
+
+# ZIP members imported as receipts
+RECEIPT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.pdf')
+
+# Uploads unpacked as ZIP archives (besides *.zip filenames)
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+
+
+class UploadTooLarge(Exception):
+    """Raised when an uploaded file or archive member exceeds the size limit"""
+
 
 class ExpenseOCRController(http.Controller):
 
-    @http.route('/api/expense/ocr/upload', type='http', auth='user', methods=['POST'], csrf=False)
+    @http.route('/api/expense/ocr/upload', type='http', auth='user', methods=['POST'], csrf=False,
+                max_content_length=lambda self: self._max_upload_bytes() + MULTIPART_OVERHEAD)
     def upload_receipt(self, **post):
         """
         Upload receipt image for OCR processing
 
+        Odoo applies the route's max_content_length before parsing the
+        body, so a request declaring an oversized body gets a 413 without
+        being read; the file part is still checked for bodies sent without
+        a length.
+
         POST data:
             - file: image file (multipart)
             - employee_id: optional employee ID
@@ -25,6 +56,8 @@ class ExpenseOCRController(http.Controller):
             JSON with OCR result and expense ID
         """
         try:
+            max_bytes = self._max_upload_bytes()
+
             # Get uploaded file
             uploaded_file = post.get('file')
             if not uploaded_file:
@@ -33,10 +66,13 @@ class ExpenseOCRController(http.Controller):
                     'error': 'No file uploaded'
                 }, status=400)
 
-            # Read file data
-            file_data = uploaded_file.read()
+            stream = uploaded_file.stream
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(0)
+            if size > max_bytes:
+                return self._too_large(max_bytes)
+
             filename = uploaded_file.filename
-            file_base64 = base64.b64encode(file_data).decode('utf-8')
 
             # Get employee (default to current user's employee)
             employee_id = post.get('employee_id')
@@ -49,45 +85,197 @@ class ExpenseOCRController(http.Controller):
                     'error': 'No employee associated with user'
                 }, status=400)
 
-            # Create OCR record
+            # Create OCR record, then store the image as its image_data
+            # attachment from the raw bytes (no base64 copies)
             ocr_record = request.env['hr.expense.ocr'].sudo().create({
-                'image_data': file_base64,
                 'image_filename': filename,
             })
+            request.env['ir.attachment'].sudo().create({
+                'name': filename or 'receipt.jpg',
+                'res_model': ocr_record._name,
+                'res_field': 'image_data',
+                'res_id': ocr_record.id,
+                'type': 'binary',
+                'raw': stream.read(),
+            })
 
-            # Process OCR
-            ocr_record.sudo().process_image()
+            # Queue OCR; poll the status endpoint for results
+            ocr_record.sudo().action_enqueue_ocr()
 
-            # Prepare response
-            response_data = {
+            return request.make_json_response({
                 'success': True,
                 'ocr_id': ocr_record.id,
-                'confidence': ocr_record.confidence,
-                'needs_review': ocr_record.needs_review,
-                'extracted_fields': {
-                    'merchant': ocr_record.merchant_name,
-                    'total_amount': ocr_record.total_amount,
-                    'currency': ocr_record.currency_code,
-                    'date': ocr_record.receipt_date.isoformat() if ocr_record.receipt_date else None,
-                    'tax_amount': ocr_record.tax_amount,
-                },
                 'state': ocr_record.state,
-            }
+                'status_url': f'/api/expense/ocr/status/{ocr_record.id}',
+            })
+
+        except Exception as e:
+            _logger.error(f"Receipt upload failed: {str(e)}", exc_info=True)
+            return request.make_json_response({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+    @http.route('/api/expense/ocr/bulk_upload', type='http', auth='user', methods=['POST'],
+                csrf=False)
+    def bulk_upload(self, **post):
+        """
+        Import many receipts at once
+
+        All receipts get their OCR records in one create() and are queued
+        together; the queue job sends them to the OCR service in batches.
+
+        POST data:
+            - files: image/PDF files and/or ZIP archives of them
+              (multipart, repeated)
+
+        Returns:
+            JSON with the import batch ID, receipt count and status URL
+        """
+        try:
+            max_bytes = self._max_upload_bytes()
+            max_files = int(request.env['ir.config_parameter'].sudo().get_param(
+                'hr_expense_ocr.bulk_max_files', DEFAULT_BULK_MAX_FILES))
+
+            with ExitStack() as stack:
+                receipts = []
+                for upload in request.httprequest.files.getlist('files'):
+                    receipts.extend(self._expand_upload(upload, max_bytes, stack))
+                    if len(receipts) > max_files:
+                        return request.make_json_response({
+                            'success': False,
+                            'error': f'Too many receipts (max {max_files})'
+                        }, status=413)
+
+                if not receipts:
+                    return request.make_json_response({
+                        'success': False,
+                        'error': 'No receipts uploaded'
+                    }, status=400)
+
+                batch = request.env['hr.expense.ocr.batch'].sudo().create({})
+                ocr_records = request.env['hr.expense.ocr'].sudo().create([
+                    {'image_filename': filename, 'batch_id': batch.id}
+                    for filename, _ in receipts
+                ])
 
-            # If expense was auto-created, include expense ID
-            if ocr_record.expense_id:
-                response_data['expense_id'] = ocr_record.expense_id.id
-                response_data['expense_reference'] = ocr_record.expense_id.name
+                attachments = request.env['ir.attachment'].sudo()
+                for start in range(0, len(receipts), ATTACHMENT_CHUNK):
+                    chunk = zip(ocr_records[start:start + ATTACHMENT_CHUNK],
+                                receipts[start:start + ATTACHMENT_CHUNK])
+                    attachments.create([{
+                        'name': filename,
+                        'res_model': record._name,
+                        'res_field': 'image_data',
+                        'res_id': record.id,
+                        'type': 'binary',
+                        'raw': read(),
+                    } for record, (filename, read) in chunk])
 
-            return request.make_json_response(response_data)
+            ocr_records.action_enqueue_ocr()
+            _logger.info(f"Bulk import {batch.name}: {len(ocr_records)} receipts queued")
+
+            return request.make_json_response({
+                'success': True,
+                'batch_id': batch.id,
+                'count': len(ocr_records),
+                'status_url': f'/api/expense/ocr/batch/{batch.id}',
+            })
+
+        except UploadTooLarge as e:
+            return request.make_json_response({
+                'success': False,
+                'error': str(e)
+            }, status=413)
+
+        except zipfile.BadZipFile as e:
+            return request.make_json_response({
+                'success': False,
+                'error': f'Invalid ZIP archive: {str(e)}'
+            }, status=400)
 
         except Exception as e:
-            _logger.error(f"Receipt upload failed: {str(e)}", exc_info=True)
+            _logger.error(f"Bulk receipt import failed: {str(e)}", exc_info=True)
             return request.make_json_response({
                 'success': False,
                 'error': str(e)
             }, status=500)
 
+    @http.route('/api/expense/ocr/batch/<int:batch_id>', type='http', auth='user', methods=['GET'])
+    def get_batch_status(self, batch_id):
+        """
+        Get bulk import progress
+
+        Args:
+            batch_id: hr.expense.ocr.batch record ID
+
+        Returns:
+            JSON with per-state counts, percent finished and per-receipt status
+        """
+        batch = request.env['hr.expense.ocr.batch'].browse(batch_id)
+        if not batch.exists():
+            return request.make_json_response({
+                'success': False,
+                'error': 'Import batch not found'
+            }, status=404)
+
+        return request.make_json_response({'success': True, **batch.get_progress()})
+
+    def _expand_upload(self, upload, max_bytes, stack):
+        """
+        Expand an uploaded part into receipts
+
+        ZIP archives are read in place from werkzeug's spooled upload and
+        kept open on `stack` until their members have been stored.
+
+        Args:
+            upload: werkzeug FileStorage
+            max_bytes: Size limit per receipt
+            stack: ExitStack owning opened archives
+
+        Returns:
+            List of (filename, callable returning the receipt bytes)
+
+        Raises:
+            UploadTooLarge: If a file or archive member exceeds max_bytes
+        """
+        stream = upload.stream
+        filename = upload.filename or 'receipt.jpg'
+
+        if filename.lower().endswith('.zip') or upload.mimetype in ZIP_MIMETYPES:
+            archive = stack.enter_context(zipfile.ZipFile(stream))
+            receipts = []
+            for member in archive.infolist():
+                name = member.filename
+                if (member.is_dir() or name.startswith('__MACOSX/')
+                        or not name.lower().endswith(RECEIPT_EXTENSIONS)):
+                    continue
+                if member.file_size > max_bytes:
+                    raise UploadTooLarge(
+                        f'{name} is too large (max {max_bytes // (1024 * 1024)} MB)')
+                receipts.append(
+                    (os.path.basename(name), lambda member=member: archive.read(member)))
+            return receipts
+
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        if size > max_bytes:
+            raise UploadTooLarge(f'{filename} is too large (max {max_bytes // (1024 * 1024)} MB)')
+        return [(filename, stream.read)]
+
+    def _max_upload_bytes(self):
+        """Upload size limit in bytes"""
+        max_mb = request.env['ir.config_parameter'].sudo().get_param(
+            'hr_expense_ocr.max_upload_mb', DEFAULT_MAX_UPLOAD_MB)
+        return int(max_mb) * 1024 * 1024
+
+    def _too_large(self, max_bytes):
+        """413 response for an oversized upload"""
+        return request.make_json_response({
+            'success': False,
+            'error': f'File too large (max {max_bytes // (1024 * 1024)} MB)'
+        }, status=413)
+
     @http.route('/api/expense/ocr/status/<int:ocr_id>', type='json', auth='user', methods=['GET'])
     def get_ocr_status(self, ocr_id):
         """
@@ -114,7 +302,17 @@ class ExpenseOCRController(http.Controller):
                 'state': ocr_record.state,
                 'confidence': ocr_record.confidence,
                 'needs_review': ocr_record.needs_review,
+                'extracted_fields': {
+                    'merchant': ocr_record.merchant_name,
+                    'total_amount': ocr_record.total_amount,
+                    'currency': ocr_record.currency_code,
+                    'date': ocr_record.receipt_date.isoformat() if ocr_record.receipt_date else None,
+                    'tax_amount': ocr_record.tax_amount,
+                },
+                'error': ocr_record.error_message or None,
                 'expense_id': ocr_record.expense_id.id if ocr_record.expense_id else None,
+                'duplicate_of': ocr_record.duplicate_of_id.id or None,
+                'duplicate_reason': ocr_record.duplicate_reason or None,
             }
 
         except Exception as e:
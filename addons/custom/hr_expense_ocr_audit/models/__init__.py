@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 
 from . import expense_ocr
+from . import expense_ocr_batch
 from . import expense_inherit
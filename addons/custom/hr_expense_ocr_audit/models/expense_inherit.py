@@ -8,6 +8,9 @@ from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
 
+# Attachment types the OCR service accepts
+OCR_MIMETYPES = ['image/jpeg', 'image/png', 'image/jpg', 'image/tiff', 'application/pdf']
+
 
 class HrExpenseInherit(models.Model):
     _inherit = 'hr.expense'
@@ -23,58 +26,69 @@ class HrExpenseInherit(models.Model):
         """
         self.ensure_one()
 
-        # Get attached images
-        attachments = self.env['ir.attachment'].search([
-            ('res_model', '=', 'hr.expense'),
-            ('res_id', '=', self.id),
-            ('mimetype', 'in', ['image/jpeg', 'image/png', 'image/jpg'])
-        ], limit=1)
-
-        if not attachments:
-            raise UserError("No image attachment found. Please attach a receipt image first.")
-
-        attachment = attachments[0]
-
-        # Create OCR record
-        ocr_vals = {
-            'expense_id': self.id,
-            'image_data': attachment.datas,
-            'image_filename': attachment.name,
+        ocr_record = self._queue_ocr()
+        if not ocr_record:
+            raise UserError(
+                "No receipt attachment found. Please attach a receipt image or PDF first.")
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'OCR Processing Queued',
+                'message': f'{ocr_record.name} queued. '
+                           f'Expense fields will be filled in once OCR completes.',
+                'type': 'info',
+                'sticky': False,
+            }
         }
 
-        ocr_record = self.env['hr.expense.ocr'].create(ocr_vals)
-
-        # Process image
-        try:
-            ocr_record.process_image()
-
-            # Update expense with OCR data if successful
-            if ocr_record.state == 'done' and not ocr_record.needs_review:
-                self._apply_ocr_data(ocr_record)
-
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': 'OCR Processing Complete',
-                    'message': f'Confidence: {ocr_record.confidence:.1%}. Review required: {ocr_record.needs_review}',
-                    'type': 'success' if not ocr_record.needs_review else 'warning',
-                    'sticky': False,
-                }
-            }
+    def _queue_ocr(self):
+        """
+        Queue OCR for the receipts attached to these expenses
 
-        except Exception as e:
-            _logger.error(f"OCR processing failed for expense #{self.id}: {str(e)}", exc_info=True)
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': 'OCR Processing Failed',
-                    'message': str(e),
-                    'type': 'danger',
-                    'sticky': True,
-                }
-            }
+        Uses one attachment search, one OCR record create() and one
+        enqueue for the whole recordset; the queue job sends the images
+        to the OCR service in batches once the transaction has committed.
+        Expenses without a receipt attachment are skipped.
+
+        Returns:
+            hr.expense.ocr records created, in expense order
+        """
+        attachments = self.env['ir.attachment'].search([
+            ('res_model', '=', 'hr.expense'),
+            ('res_id', 'in', self.ids),
+            ('mimetype', 'in', OCR_MIMETYPES)
+        ], order='id')
+
+        # First receipt attached to each expense
+        receipts = {}
+        for attachment in attachments:
+            receipts.setdefault(attachment.res_id, attachment)
+
+        expenses = self.filtered(lambda expense: expense.id in receipts)
+        if not expenses:
+            return self.env['hr.expense.ocr']
+
+        ocr_records = self.env['hr.expense.ocr'].create([{
+            'expense_id': expense.id,
+            'image_filename': receipts[expense.id].name,
+        } for expense in expenses])
+
+        # Copy the receipts as the OCR records' images from raw bytes
+        # (the filestore deduplicates them by checksum)
+        self.env['ir.attachment'].sudo().create([{
+            'name': receipts[expense.id].name,
+            'res_model': ocr_record._name,
+            'res_field': 'image_data',
+            'res_id': ocr_record.id,
+            'type': 'binary',
+            'raw': receipts[expense.id].raw,
+        } for expense, ocr_record in zip(expenses, ocr_records)])
+
+        # Queue images for OCR; the expenses are updated when the job completes
+        ocr_records.action_enqueue_ocr()
+        return ocr_records
 
     def _apply_ocr_data(self, ocr_record):
         """
@@ -115,10 +129,14 @@ class HrExpenseInherit(models.Model):
         auto_ocr_enabled = self.env['ir.config_parameter'].sudo().get_param('hr_expense_ocr.auto_process', 'False')
 
         if auto_ocr_enabled == 'True':
-            for expense in expenses:
-                try:
-                    expense.action_process_with_ocr()
-                except Exception as e:
-                    _logger.warning(f"Auto-OCR failed for expense #{expense.id}: {str(e)}")
+            try:
+                # A failure must not roll back the expenses themselves
+                with self.env.cr.savepoint():
+                    ocr_records = expenses._queue_ocr()
+                if ocr_records:
+                    _logger.info(f"Auto-OCR queued for {len(ocr_records)} of "
+                                 f"{len(expenses)} new expenses")
+            except Exception as e:
+                _logger.warning(f"Auto-OCR failed for expenses {expenses.ids}: {str(e)}")
 
         return expenses
@@ -1,19 +1,42 @@
 # -*- coding: utf-8 -*-
 
-import base64
 import io
 import logging
-import os
 import requests
+from contextlib import ExitStack
 from datetime import datetime
 
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from odoo.addons.queue_job.exception import RetryableJobError
+
+from ..services import image_hash
+from ..services.ocr_client import OcrCircuitOpen, get_ocr_client
 
 _logger = logging.getLogger(__name__)
 
-OCR_SERVICE_URL = "http://ocr-service:8000"
-OCR_API_KEY = os.environ.get('OCR_API_KEY', '')
+# Identity key collapsing repeated enqueues into one pending batch job
+OCR_BATCH_JOB_KEY = 'hr_expense_ocr_process_pending_batch'
+DEFAULT_OCR_BATCH_SIZE = 16
+
+# Image bytes sent per batch request; kept under the OCR service's request
+# limit (OCR_MAX_REQUEST_MB, 200 by default)
+DEFAULT_OCR_BATCH_MAX_MB = 100
+
+# Name each receipt is uploaded under; the service echoes it in the result,
+# which is how batch results are matched back to their records. Never the
+# user's filename: an upload named like an archive would be unpacked
+OCR_UPLOAD_FILENAME = 'receipt-{}.jpg'
+
+# The OCR service returns ISO dates; the others are accepted from older
+# service versions
+OCR_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%d.%m.%Y')
+
+# Result fields copied from an earlier upload of the identical file
+OCR_RESULT_FIELDS = (
+    'ocr_success', 'confidence', 'raw_text', 'extracted_data', 'merchant_name',
+    'total_amount', 'currency_code', 'receipt_date', 'tax_amount', 'fingerprint',
+)
 
 
 class ExpenseOCR(models.Model):
@@ -53,72 +76,444 @@ class ExpenseOCR(models.Model):
 
     error_message = fields.Text('Error Message')
 
+    batch_id = fields.Many2one('hr.expense.ocr.batch', string='Import Batch',
+                               ondelete='set null', index=True)
+
+    # Duplicate detection: perceptual image hash, split into indexed bands
+    # for near-match lookups, and the normalized merchant|date|total key
+    image_hash = fields.Char('Image Hash', index=True, readonly=True, copy=False)
+    image_hash_band_0 = fields.Integer(index=True, readonly=True, copy=False)
+    image_hash_band_1 = fields.Integer(index=True, readonly=True, copy=False)
+    image_hash_band_2 = fields.Integer(index=True, readonly=True, copy=False)
+    image_hash_band_3 = fields.Integer(index=True, readonly=True, copy=False)
+    fingerprint = fields.Char('Receipt Fingerprint', index=True, readonly=True, copy=False,
+                              help="Normalized merchant|date|total of the extracted fields")
+
+    duplicate_of_id = fields.Many2one('hr.expense.ocr', string='Possible Duplicate Of',
+                                      ondelete='set null', readonly=True, copy=False)
+    duplicate_reason = fields.Selection([
+        ('exact', 'Identical file'),
+        ('image', 'Similar image'),
+        ('fields', 'Same merchant, date and total'),
+    ], string='Duplicate Reason', readonly=True, copy=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        unnamed = [vals for vals in vals_list if vals.get('name', 'New') == 'New']
+        for vals, name in zip(unnamed, self._next_names(len(unnamed))):
+            vals['name'] = name
+        return super(ExpenseOCR, self).create(vals_list)
+
     @api.model
-    def create(self, vals):
-        if vals.get('name', 'New') == 'New':
-            vals['name'] = self.env['ir.sequence'].next_by_code('hr.expense.ocr') or 'New'
-        return super(ExpenseOCR, self).create(vals)
+    def _next_names(self, count):
+        """
+        Draw `count` references from the hr.expense.ocr sequence
+
+        Standard (gapped) sequences are advanced with a single query;
+        no-gap sequences fall back to one next_by_code() call per name.
+
+        Args:
+            count: Number of references needed
 
-    def process_image(self):
+        Returns:
+            List of `count` references
         """
-        Send image to OCR service and process results
+        if not count:
+            return []
+
+        sequence = self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'hr.expense.ocr'),
+            ('company_id', 'in', [self.env.company.id, False]),
+        ], order='company_id', limit=1)
+        if not sequence:
+            return ['New'] * count
+
+        if sequence.implementation != 'standard' or sequence.use_date_range:
+            return [sequence.next_by_id() for _ in range(count)]
+
+        self.env.cr.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)",
+            (f'ir_sequence_{sequence.id:03d}', count)
+        )
+        return [sequence.get_next_char(number) for number, in self.env.cr.fetchall()]
+
+    def action_enqueue_ocr(self):
         """
-        self.ensure_one()
+        Queue records for asynchronous OCR processing
 
-        if not self.image_data:
+        Records are flagged as processing and picked up in batches by the
+        queue job runner, so the calling HTTP worker returns immediately.
+        """
+        if not self:
+            return True
+
+        if self.with_context(bin_size=True).filtered(lambda r: not r.image_data):
             raise UserError("No image data to process.")
 
-        self.write({'state': 'processing'})
+        self.write({'state': 'processing', 'error_message': False})
+        self._schedule_pending_batch()
+        _logger.info(f"Queued OCR for records {self.ids}")
+        return True
 
+    @api.model
+    def _schedule_pending_batch(self):
+        """
+        Schedule the batch job unless one is already waiting to run
+        """
+        self.with_delay(
+            channel='root.ocr',
+            identity_key=OCR_BATCH_JOB_KEY,
+            description='Process pending expense OCR',
+        )._process_pending_batch()
+
+    @api.model
+    def _process_pending_batch(self):
+        """
+        Queue job: send the oldest pending OCR records to the OCR service
+
+        Processes one batch per job run and re-schedules itself while
+        records are still waiting. A batch holds up to
+        hr_expense_ocr.batch_size records and hr_expense_ocr.batch_max_mb
+        of images.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        batch_size = int(params.get_param('hr_expense_ocr.batch_size', DEFAULT_OCR_BATCH_SIZE))
+        max_bytes = int(params.get_param(
+            'hr_expense_ocr.batch_max_mb', DEFAULT_OCR_BATCH_MAX_MB)) * 1024 * 1024
+        pending = self.search([('state', '=', 'processing')], order='id', limit=batch_size)
+        if not pending:
+            return
+
+        pending = pending._leading_within_bytes(max_bytes)
+
+        pending._process_batch()
+
+        if self.search_count([('state', '=', 'processing'), ('id', 'not in', pending.ids)]):
+            self._schedule_pending_batch()
+
+    def _leading_within_bytes(self, max_bytes):
+        """
+        The leading records whose images fit in max_bytes together
+
+        Args:
+            max_bytes: Byte budget of the images
+
+        Returns:
+            Prefix of these records, never empty when self is not
+        """
+        attachments = self._image_attachments()
+        total = 0
+        for count, record in enumerate(self):
+            attachment = attachments.get(record.id)
+            total += attachment.file_size if attachment else 0
+            if count and total > max_bytes:
+                return self[:count]
+        return self
+
+    def _process_batch(self):
+        """
+        Send these records to the OCR service in one batch request and
+        write the per-image results back
+
+        Identical re-uploads of an already processed receipt take its
+        result instead of being sent.
+
+        Raises:
+            RetryableJobError: If the OCR service is busy or unreachable
+        """
+        records = self._check_duplicates()
+        if not records:
+            return
+
+        _logger.info(f"Processing OCR batch: {len(records)} records")
+        records._send_batch()
+
+    def _send_batch(self):
+        """
+        Post these records' images to the OCR service and apply the results
+
+        Results are matched to records by their upload filename; a record
+        the service returned no result for is marked failed rather than
+        left processing. A batch the service rejects as too large (413) is
+        split in half and each half sent on its own; a single image it
+        rejects is marked failed.
+
+        Raises:
+            RetryableJobError: If the OCR service is busy or unreachable
+        """
         try:
-            # Prepare image for API call
-            image_bytes = base64.b64decode(self.image_data)
-
-            # Prepare headers with API key
-            headers = {}
-            if OCR_API_KEY:
-                headers['X-API-Key'] = OCR_API_KEY
-            else:
-                _logger.warning("OCR_API_KEY environment variable not set - OCR request may fail")
-
-            # Call OCR service
-            _logger.info(f"Processing OCR for expense OCR #{self.id}")
-            response = requests.post(
-                f"{OCR_SERVICE_URL}/v1/parse",
-                headers=headers,
-                files={'file': (self.image_filename or 'receipt.jpg', io.BytesIO(image_bytes), 'image/jpeg')},
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                self._process_ocr_result(result)
-            else:
-                error_msg = f"OCR service returned {response.status_code}: {response.text}"
-                _logger.error(error_msg)
-                self.write({
+            with ExitStack() as stack:
+                files = [
+                    ('files', record._open_ocr_upload(stack))
+                    for record in self
+                ]
+                response = get_ocr_client().post(
+                    '/v1/parse/batch',
+                    files=files,
+                    params=self._ocr_params(),
+                    timeout=30 + 10 * len(self)
+                )
+        except OcrCircuitOpen as e:
+            raise RetryableJobError(str(e), seconds=int(get_ocr_client().circuit_cooldown))
+        except requests.exceptions.RequestException as e:
+            raise RetryableJobError(f"OCR service connection failed: {str(e)}", seconds=30)
+
+        if response.status_code == 429:
+            raise RetryableJobError(
+                "OCR service busy", seconds=int(response.headers.get('Retry-After', 10)))
+
+        if response.status_code == 413 and len(self) > 1:
+            half = len(self) // 2
+            _logger.warning(f"OCR batch of {len(self)} too large, splitting")
+            self[:half]._send_batch()
+            self[half:]._send_batch()
+            return
+
+        if response.status_code != 200:
+            error_msg = f"OCR service returned {response.status_code}: {response.text}"
+            _logger.error(error_msg)
+            self.write({'state': 'failed', 'error_message': error_msg})
+            return
+
+        results = {
+            result.get('filename'): result
+            for result in response.json().get('results', [])
+        }
+        for record in self:
+            result = results.get(OCR_UPLOAD_FILENAME.format(record.id))
+            if result is None:
+                _logger.error(f"OCR service returned no result for OCR #{record.id}")
+                record.write({
                     'state': 'failed',
-                    'error_message': error_msg
+                    'error_message': "OCR service returned no result for this receipt",
                 })
-                raise UserError(f"OCR processing failed: {error_msg}")
+                continue
+            try:
+                record._process_ocr_result(result)
+            except Exception as e:
+                _logger.error(f"Applying OCR result failed for OCR #{record.id}: {str(e)}",
+                              exc_info=True)
+                record.write({'state': 'failed', 'error_message': str(e)})
 
-        except requests.exceptions.RequestException as e:
-            error_msg = f"OCR service connection failed: {str(e)}"
-            _logger.error(error_msg, exc_info=True)
-            self.write({
-                'state': 'failed',
-                'error_message': error_msg
-            })
-            raise UserError(error_msg)
+    @api.model
+    def _ocr_params(self):
+        """
+        Query parameters for OCR service calls
 
-        except Exception as e:
-            error_msg = f"Unexpected error during OCR processing: {str(e)}"
-            _logger.error(error_msg, exc_info=True)
-            self.write({
-                'state': 'failed',
-                'error_message': error_msg
-            })
-            raise UserError(error_msg)
+        The hr_expense_ocr.rules parameter picks the service's extraction
+        rule set (e.g. en_PH, eu); unset uses the service default.
+        """
+        rules = self.env['ir.config_parameter'].sudo().get_param('hr_expense_ocr.rules')
+        return {'rules': rules} if rules else None
+
+    def _open_ocr_upload(self, stack):
+        """
+        Open the stored receipt image for upload without base64 round-trips
+
+        Filestore-backed images are streamed straight from disk; images
+        stored in the database fall back to their raw bytes. The upload is
+        named after the record (see OCR_UPLOAD_FILENAME) and only sent as
+        an image or PDF, so the service never unpacks it as an archive.
+
+        Args:
+            stack: ExitStack that closes the opened file
+
+        Returns:
+            (filename, file object, mimetype) tuple for requests' files=
+        """
+        self.ensure_one()
+
+        attachment = self._image_attachments().get(self.id)
+        if not attachment:
+            raise UserError("No image data to process.")
+
+        mimetype = attachment.mimetype or ''
+        if not (mimetype.startswith('image/') or mimetype == 'application/pdf'):
+            mimetype = 'image/jpeg'
+        return (
+            OCR_UPLOAD_FILENAME.format(self.id),
+            self._open_attachment(attachment, stack),
+            mimetype,
+        )
+
+    def _image_attachments(self):
+        """
+        Attachments holding these records' receipt images
+
+        Returns:
+            Dict of record id -> ir.attachment
+        """
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', self.ids),
+            ('res_field', '=', 'image_data'),
+        ])
+        return {attachment.res_id: attachment for attachment in attachments}
+
+    @api.model
+    def _open_attachment(self, attachment, stack):
+        """
+        Binary file object for an attachment's content
+
+        Filestore-backed attachments are opened from disk; attachments
+        stored in the database fall back to their raw bytes.
+
+        Args:
+            attachment: ir.attachment record
+            stack: ExitStack that closes the opened file
+        """
+        if attachment.store_fname:
+            return stack.enter_context(open(attachment._full_path(attachment.store_fname), 'rb'))
+        return io.BytesIO(attachment.raw)
+
+    def _check_duplicates(self):
+        """
+        Hash the receipt images and flag likely duplicates before OCR
+
+        A file identical to an earlier, successfully processed upload
+        takes that upload's result and skips inference. Images within
+        image_hash.MAX_DISTANCE bits of an earlier upload (re-encoded,
+        rescaled or re-exported copies) are flagged and still processed;
+        the flag is dropped again if OCR reads different fields. Earlier
+        OCR runs of the same expense are re-runs, not duplicates.
+
+        Returns:
+            The records that still need OCR
+        """
+        self.write({'duplicate_of_id': False, 'duplicate_reason': False})
+        attachments = self._image_attachments()
+        self._store_image_hashes(attachments)
+
+        # Identical files: same content checksum on an earlier record
+        checksums = {
+            attachment.checksum for attachment in attachments.values() if attachment.checksum
+        }
+        originals = {}
+        if checksums:
+            matches = self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'image_data'),
+                ('checksum', 'in', list(checksums)),
+            ], order='res_id')
+            for attachment in matches:
+                originals.setdefault(attachment.checksum, []).append(attachment.res_id)
+
+        candidates = self._similar_image_candidates()
+
+        copied = self.browse()
+        for record in self:
+            attachment = attachments.get(record.id)
+            earlier = [
+                res_id for res_id in originals.get(attachment.checksum, [])
+                if res_id < record.id and not record._same_expense(self.browse(res_id))
+            ] if attachment else []
+
+            if earlier:
+                original = self.browse(earlier[0])
+                record.write({'duplicate_of_id': original.id, 'duplicate_reason': 'exact'})
+                if original.ocr_success and original.state in ('done', 'review'):
+                    record._copy_ocr_result(original)
+                    copied |= record
+                continue
+
+            original, distance = record._nearest_image_match(candidates)
+            if original:
+                _logger.info(f"OCR #{record.id} looks like OCR #{original.id} "
+                             f"(image hash distance {distance})")
+                record.write({'duplicate_of_id': original.id, 'duplicate_reason': 'image'})
+
+        if copied:
+            _logger.info(f"Skipped OCR for identical re-uploads: {copied.ids}")
+        return self - copied
+
+    def _store_image_hashes(self, attachments):
+        """
+        Compute and store the perceptual hash of records that lack one
+
+        Args:
+            attachments: Dict of record id -> ir.attachment
+        """
+        for record in self.filtered(lambda r: not r.image_hash):
+            attachment = attachments.get(record.id)
+            if not attachment:
+                continue
+            with ExitStack() as stack:
+                value = image_hash.image_hash(self._open_attachment(attachment, stack))
+            if value is None:
+                continue
+
+            vals = {'image_hash': image_hash.hash_to_hex(value)}
+            for band, band_value in enumerate(image_hash.hash_bands(value)):
+                vals[f'image_hash_band_{band}'] = band_value
+            record.write(vals)
+
+    def _similar_image_candidates(self):
+        """
+        Earlier records sharing at least one hash band with these records
+
+        One indexed lookup per band column covers every record within
+        image_hash.MAX_DISTANCE bits of any of these hashes.
+        """
+        hashed = self.filtered('image_hash')
+        if not hashed:
+            return self.browse()
+
+        domain = []
+        for band in range(image_hash.BAND_COUNT):
+            field_name = f'image_hash_band_{band}'
+            domain.append((field_name, 'in', list(set(hashed.mapped(field_name)))))
+        domain = ['|'] * (len(domain) - 1) + domain
+        return self.search(domain + [
+            ('image_hash', '!=', False),
+            ('id', '<', max(hashed.ids)),
+        ], order='id')
+
+    def _nearest_image_match(self, candidates):
+        """
+        Closest earlier record by image hash Hamming distance
+
+        Records that are themselves flagged duplicates resolve to the
+        upload they duplicate, so repeated re-uploads point at the first.
+
+        Args:
+            candidates: Records from _similar_image_candidates()
+
+        Returns:
+            (record, distance), or (None, None) if nothing is close enough
+        """
+        self.ensure_one()
+        if not self.image_hash:
+            return None, None
+
+        value = int(self.image_hash, 16)
+        best, best_distance = None, None
+        for candidate in candidates:
+            if candidate.id >= self.id or self._same_expense(candidate):
+                continue
+            distance = image_hash.hamming(value, int(candidate.image_hash, 16))
+            if distance <= image_hash.MAX_DISTANCE and (best is None or distance < best_distance):
+                best, best_distance = candidate, distance
+
+        if best and best.duplicate_of_id and not self._same_expense(best.duplicate_of_id):
+            best = best.duplicate_of_id
+        return best, best_distance
+
+    def _same_expense(self, other):
+        """Whether another OCR record was run for this record's expense"""
+        self.ensure_one()
+        return bool(self.expense_id) and other.expense_id == self.expense_id
+
+    def _copy_ocr_result(self, original):
+        """
+        Take the OCR result of an identical earlier upload
+
+        The copy always goes to the review queue instead of creating an
+        expense, since the receipt has most likely been claimed already.
+        """
+        self.ensure_one()
+        vals = {field_name: original[field_name] for field_name in OCR_RESULT_FIELDS}
+        vals.update({'needs_review': True, 'state': 'review', 'error_message': False})
+        self.write(vals)
 
     def _process_ocr_result(self, result):
         """
@@ -144,13 +539,12 @@ class ExpenseOCR(models.Model):
         # Parse date if available
         receipt_date = None
         if extracted.get('date'):
-            try:
-                receipt_date = datetime.strptime(extracted['date'], '%m/%d/%Y').date()
-            except ValueError:
-                try:
-                    receipt_date = datetime.strptime(extracted['date'], '%Y-%m-%d').date()
-                except ValueError:
-                    _logger.warning(f"Could not parse date: {extracted.get('date')}")
+            receipt_date = self._parse_ocr_date(extracted['date'])
+            if not receipt_date:
+                _logger.warning(f"Could not parse date: {extracted.get('date')}")
+
+        fingerprint = image_hash.receipt_fingerprint(
+            extracted.get('merchant'), receipt_date, extracted.get('total_amount'))
 
         # Update record
         vals = {
@@ -163,18 +557,81 @@ class ExpenseOCR(models.Model):
             'currency_code': extracted.get('currency', 'USD'),
             'receipt_date': receipt_date,
             'tax_amount': extracted.get('tax_amount', 0.0),
-            'needs_review': needs_review,
-            'state': 'review' if needs_review else 'done'
+            'fingerprint': fingerprint,
         }
+        vals.update(self._check_fingerprint(fingerprint))
+        if vals.get('duplicate_of_id', self.duplicate_of_id):
+            needs_review = True
+        vals.update({
+            'needs_review': needs_review,
+            'state': 'review' if needs_review else 'done',
+        })
 
         self.write(vals)
 
-        # Auto-create expense if confidence is high
+        # Auto-create expense if confidence is high, or fill in the expense
+        # this OCR run was requested from
         if not needs_review and not self.expense_id:
             self._create_expense_from_ocr()
+        elif not needs_review:
+            self.expense_id._apply_ocr_data(self)
 
         _logger.info(f"OCR completed: ID={self.id}, confidence={confidence:.2f}, review={needs_review}")
 
+    def _check_fingerprint(self, fingerprint):
+        """
+        Compare the extracted fields with other receipts
+
+        A receipt with the merchant, date and total of another one is
+        flagged as its duplicate, unless it is an OCR run of the same
+        expense. A similar-image flag is dropped when the two receipts
+        read to different fields: same-template receipts from one vendor
+        often hash alike.
+
+        Args:
+            fingerprint: receipt_fingerprint() of this record's fields
+
+        Returns:
+            Dict of duplicate field values to write
+        """
+        self.ensure_one()
+        if self.duplicate_reason == 'image':
+            original = self.duplicate_of_id
+            if fingerprint and original.fingerprint and original.fingerprint != fingerprint:
+                return {'duplicate_of_id': False, 'duplicate_reason': False}
+            return {}
+
+        if self.duplicate_of_id or not fingerprint:
+            return {}
+
+        domain = [('fingerprint', '=', fingerprint), ('id', '!=', self.id)]
+        if self.expense_id:
+            domain.append(('expense_id', '!=', self.expense_id.id))
+        original = self.search(domain, order='id', limit=1)
+        if not original:
+            return {}
+
+        _logger.info(f"OCR #{self.id} has the same fields as OCR #{original.id}")
+        return {'duplicate_of_id': original.id, 'duplicate_reason': 'fields'}
+
+    @api.model
+    def _parse_ocr_date(self, value):
+        """
+        Parse a date returned by the OCR service
+
+        Args:
+            value: Date string, normally YYYY-MM-DD
+
+        Returns:
+            datetime.date, or None if no known format matches
+        """
+        for date_format in OCR_DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        return None
+
     def _create_expense_from_ocr(self):
         """
         Create hr.expense record from OCR results
@@ -193,6 +650,11 @@ class ExpenseOCR(models.Model):
             'ocr_confidence': self.confidence,
         }
 
+        # Receipts in PHP, EUR, ... keep their currency when it is active
+        currency = self.env['res.currency'].search([('name', '=', self.currency_code)], limit=1)
+        if currency:
+            expense_vals['currency_id'] = currency.id
+
         # Create expense
         expense = self.env['hr.expense'].create(expense_vals)
 
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+# OCR record states that no longer change without user action
+OCR_FINISHED_STATES = ('done', 'review', 'failed')
+
+
+class ExpenseOCRBatch(models.Model):
+    _name = 'hr.expense.ocr.batch'
+    _description = 'Bulk Receipt Import'
+    _order = 'create_date desc'
+
+    name = fields.Char('Reference', required=True, default='New')
+    ocr_ids = fields.One2many('hr.expense.ocr', 'batch_id', string='Receipts')
+
+    # Progress, counted from the OCR records' states
+    total_count = fields.Integer('Receipts', compute='_compute_progress')
+    pending_count = fields.Integer('Pending', compute='_compute_progress')
+    done_count = fields.Integer('Done', compute='_compute_progress')
+    review_count = fields.Integer('Needs Review', compute='_compute_progress')
+    failed_count = fields.Integer('Failed', compute='_compute_progress')
+    progress = fields.Float('Progress (%)', compute='_compute_progress')
+    state = fields.Selection([
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+    ], string='Status', compute='_compute_progress')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            if vals.get('name', 'New') == 'New':
+                vals['name'] = f"Import {fields.Datetime.to_string(fields.Datetime.now())}"
+        return super().create(vals_list)
+
+    @api.depends('ocr_ids.state')
+    def _compute_progress(self):
+        """Count receipts per OCR state with one grouped query for all batches"""
+        counts = {}
+        if self.ids:
+            groups = self.env['hr.expense.ocr']._read_group(
+                [('batch_id', 'in', self.ids)], ['batch_id', 'state'], ['__count'])
+            for batch, state, count in groups:
+                counts.setdefault(batch.id, {})[state] = count
+
+        for batch in self:
+            states = counts.get(batch.id, {})
+            total = sum(states.values())
+            finished = sum(states.get(state, 0) for state in OCR_FINISHED_STATES)
+            batch.total_count = total
+            batch.pending_count = total - finished
+            batch.done_count = states.get('done', 0)
+            batch.review_count = states.get('review', 0)
+            batch.failed_count = states.get('failed', 0)
+            batch.progress = 100.0 * finished / total if total else 100.0
+            batch.state = 'done' if finished == total else 'processing'
+
+    def get_progress(self):
+        """
+        Progress summary for the bulk import status endpoint
+
+        Returns:
+            Dict with per-state counts and per-receipt status
+        """
+        self.ensure_one()
+        return {
+            'batch_id': self.id,
+            'name': self.name,
+            'state': self.state,
+            'progress': round(self.progress, 1),
+            'total': self.total_count,
+            'pending': self.pending_count,
+            'done': self.done_count,
+            'review': self.review_count,
+            'failed': self.failed_count,
+            'receipts': [{
+                'ocr_id': record.id,
+                'filename': record.image_filename,
+                'state': record.state,
+                'confidence': record.confidence,
+                'expense_id': record.expense_id.id or None,
+                'error': record.error_message or None,
+                'duplicate_of': record.duplicate_of_id.id or None,
+            } for record in self.ocr_ids],
+        }
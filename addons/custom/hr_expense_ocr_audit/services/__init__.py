@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import image_hash
+from . import ocr_client
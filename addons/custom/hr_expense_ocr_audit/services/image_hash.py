@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import re
+
+from PIL import Image, ImageOps
+
+_logger = logging.getLogger(__name__)
+
+# dHash grid: each of the 8 rows compares 9 neighbouring pixels, giving 64 bits
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# Multi-index hashing: the hash is split into bands stored as separate
+# indexed columns. Two hashes within BAND_COUNT - 1 bits of each other share
+# at least one band exactly, so an equality lookup per band finds every
+# near-duplicate candidate without scanning the table.
+BAND_COUNT = 4
+BAND_BITS = HASH_BITS // BAND_COUNT
+MAX_DISTANCE = BAND_COUNT - 1
+
+
+def image_hash(fileobj):
+    """
+    Perceptual difference hash (dHash) of a receipt image
+
+    The image is decoded at reduced size (JPEG draft mode), turned upright
+    from its EXIF orientation and shrunk to a 9x8 grayscale grid; each bit
+    records whether a pixel is brighter than its right-hand neighbour.
+    Re-compressed, rescaled or re-exported copies of a receipt hash to the
+    same or nearby values.
+
+    Args:
+        fileobj: Path or binary file object of the image
+
+    Returns:
+        64-bit hash as an int, or None for files Pillow cannot read (PDFs)
+    """
+    try:
+        with Image.open(fileobj) as image:
+            image.draft('L', (HASH_SIZE * 16, HASH_SIZE * 16))
+            image = ImageOps.exif_transpose(image)
+            grid = image.convert('L').resize(
+                (HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+            pixels = grid.tobytes()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        _logger.debug(f"Image hash skipped: {str(e)}")
+        return None
+
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_to_hex(value):
+    """Fixed-width hex form of a hash, as stored on hr.expense.ocr"""
+    return f"{value:0{HASH_BITS // 4}x}"
+
+
+def hash_bands(value):
+    """
+    Split a hash into BAND_COUNT integers for the indexed band columns
+
+    Returns:
+        List of BAND_COUNT ints, most significant band first
+    """
+    mask = (1 << BAND_BITS) - 1
+    return [
+        (value >> (BAND_BITS * (BAND_COUNT - 1 - band))) & mask
+        for band in range(BAND_COUNT)
+    ]
+
+
+def hamming(first, second):
+    """Number of differing bits between two hashes"""
+    return bin(first ^ second).count('1')
+
+
+def receipt_fingerprint(merchant, receipt_date, total_amount):
+    """
+    Normalized merchant + date + total key of an extracted receipt
+
+    The same receipt photographed twice rarely hashes alike, but it reads
+    to the same fields. Merchant names are lowercased with punctuation and
+    spacing removed so OCR noise like "STARBUCKS #123" vs "Starbucks 123"
+    matches.
+
+    Args:
+        merchant: Extracted merchant name
+        receipt_date: datetime.date of the receipt
+        total_amount: Extracted total
+
+    Returns:
+        Fingerprint string, or None unless all three fields are present
+    """
+    merchant = re.sub(r'[^0-9a-z]+', '', (merchant or '').lower())
+    if not merchant or not receipt_date or not total_amount:
+        return None
+    return f"{merchant}|{receipt_date.isoformat()}|{total_amount:.2f}"
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+OCR_SERVICE_URL = os.environ.get('OCR_SERVICE_URL', 'http://ocr-service:8000')
+OCR_API_KEY = os.environ.get('OCR_API_KEY', '')
+
+# Keep-alive connections kept per Odoo worker process
+OCR_HTTP_POOL_SIZE = int(os.environ.get('OCR_HTTP_POOL_SIZE', '4'))
+
+# Extra attempts on connection errors and gateway-type 5xx responses
+OCR_HTTP_RETRIES = int(os.environ.get('OCR_HTTP_RETRIES', '2'))
+OCR_HTTP_BACKOFF = float(os.environ.get('OCR_HTTP_BACKOFF', '0.5'))
+
+# Consecutive failures that open the circuit, and how long it stays open
+OCR_CIRCUIT_THRESHOLD = int(os.environ.get('OCR_CIRCUIT_THRESHOLD', '5'))
+OCR_CIRCUIT_COOLDOWN = float(os.environ.get('OCR_CIRCUIT_COOLDOWN', '30'))
+
+# Responses worth retrying; 500 is a deterministic processing error
+RETRY_STATUSES = (502, 503, 504)
+
+
+class OcrCircuitOpen(requests.exceptions.ConnectionError):
+    """Raised without contacting the OCR service while the circuit is open"""
+
+
+class OcrClient:
+    """
+    Pooled HTTP client for the OCR service
+
+    One instance lives in each Odoo worker process and keeps connections
+    to the OCR service alive between calls. Connection errors and 502/503/504
+    responses are retried with jittered exponential backoff; after
+    OCR_CIRCUIT_THRESHOLD consecutive failures the circuit opens and calls
+    fail fast for OCR_CIRCUIT_COOLDOWN seconds, then a single probe call
+    is let through.
+    """
+
+    def __init__(self, base_url=OCR_SERVICE_URL, api_key=OCR_API_KEY,
+                 pool_size=OCR_HTTP_POOL_SIZE, retries=OCR_HTTP_RETRIES,
+                 backoff=OCR_HTTP_BACKOFF, circuit_threshold=OCR_CIRCUIT_THRESHOLD,
+                 circuit_cooldown=OCR_CIRCUIT_COOLDOWN):
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.circuit_threshold = circuit_threshold
+        self.circuit_cooldown = circuit_cooldown
+
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['X-API-Key'] = api_key
+        else:
+            _logger.warning("OCR_API_KEY environment variable not set - OCR request may fail")
+
+    def post(self, path, files, timeout=30, params=None):
+        """
+        POST multipart files to the OCR service
+
+        Args:
+            path: Endpoint path, e.g. '/v1/parse'
+            files: requests-style files list/dict; file objects are rewound
+                before every attempt so they can be streamed again
+            timeout: Per-attempt timeout in seconds
+            params: Optional query parameters
+
+        Returns:
+            requests.Response (the last one if all retries returned 5xx)
+
+        Raises:
+            OcrCircuitOpen: If the circuit is open
+            requests.exceptions.RequestException: If every attempt failed
+        """
+        attempt = 0
+        while True:
+            self._check_circuit()
+            self._rewind(files)
+            try:
+                response = self.session.post(f"{self.base_url}{path}", files=files, params=params,
+                                             timeout=timeout)
+            except requests.exceptions.RequestException:
+                self._record_failure()
+                if attempt >= self.retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self._record_success()
+                    return response
+                self._record_failure()
+                if attempt >= self.retries:
+                    return response
+
+            attempt += 1
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            _logger.info(f"Retrying OCR request {path} in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+
+    @staticmethod
+    def _rewind(files):
+        """Seek every file object back to the start"""
+        entries = files.values() if isinstance(files, dict) else [entry for _, entry in files]
+        for entry in entries:
+            fileobj = entry[1] if isinstance(entry, tuple) else entry
+            if hasattr(fileobj, 'seek'):
+                fileobj.seek(0)
+
+    def _check_circuit(self):
+        """Fail fast while the circuit is open; allow one probe after cooldown"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.circuit_cooldown:
+                raise OcrCircuitOpen(
+                    f"OCR service unavailable (circuit open after {self._failures} failures)")
+            # Half-open: let this call through, re-open on its failure
+            self._opened_at = None
+            self._failures = self.circuit_threshold - 1
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.circuit_threshold and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                _logger.error(f"OCR service circuit opened after {self._failures} "
+                              f"consecutive failures")
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+
+_client = None
+_client_pid = None
+
+
+def get_ocr_client():
+    """
+    Return this process's OCR client, creating it on first use
+
+    Keyed by PID so prefork workers never share sockets inherited from
+    the parent process.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = OcrClient()
+        _client_pid = os.getpid()
+    return _client
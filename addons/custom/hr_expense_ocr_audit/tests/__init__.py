@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import test_batch
+from . import test_duplicates
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import io
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw
+
+from odoo.tests import TransactionCase, tagged
+
+from .test_duplicates import OCR_RESULT
+
+CLIENT = 'odoo.addons.hr_expense_ocr_audit.models.expense_ocr.get_ocr_client'
+
+
+def receipt_png(seed):
+    """A receipt-like PNG whose layout (and hash) depends on `seed`"""
+    image = Image.new('L', (120, 240), 255)
+    draw = ImageDraw.Draw(image)
+    for row in range(10, 230, 18):
+        draw.rectangle((10, row, 40 + (row * seed) % 70, row + 8), fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def ocr_result(filename, total):
+    """A service result for `filename`, kept for review so no expense is created"""
+    extracted = dict(OCR_RESULT['extracted_fields'], total_amount=total)
+    return dict(OCR_RESULT, filename=filename, needs_review=True, extracted_fields=extracted)
+
+
+class FakeResponse:
+    headers = {}
+    text = ''
+
+    def __init__(self, results, status_code=200):
+        self._results = results
+        self.status_code = status_code
+
+    def json(self):
+        return {'results': self._results}
+
+
+@tagged('post_install', '-at_install')
+class TestBatchResults(TransactionCase):
+
+    def _pending(self, count):
+        return self.env['hr.expense.ocr'].create([{
+            'image_data': base64.b64encode(receipt_png(seed)),
+            'image_filename': 'scans.zip',
+            'state': 'processing',
+        } for seed in range(3, 3 + count)])
+
+    def _process(self, records, respond):
+        """
+        Run _process_batch against a fake service
+
+        Returns:
+            Upload filenames of each request; respond(filenames) gives
+            the request's FakeResponse
+        """
+        requests = []
+
+        def post(path, files, **kwargs):
+            requests.append([name for _, (name, fileobj, mimetype) in files])
+            return respond(requests[-1])
+
+        with patch(CLIENT) as client:
+            client.return_value.post.side_effect = post
+            records._process_batch()
+        return requests
+
+    def test_results_are_matched_by_upload_name(self):
+        first, second = self._pending(2)
+        requests = self._process(first | second, lambda names: FakeResponse([
+            ocr_result(names[1], 20.0), ocr_result(names[0], 10.0),
+        ]))
+
+        self.assertEqual(requests, [[f'receipt-{first.id}.jpg', f'receipt-{second.id}.jpg']])
+        self.assertEqual(first.total_amount, 10.0)
+        self.assertEqual(second.total_amount, 20.0)
+        self.assertEqual((first | second).mapped('state'), ['review', 'review'])
+
+    def test_record_without_result_fails(self):
+        first, second = self._pending(2)
+        self._process(first | second, lambda names: FakeResponse([ocr_result(names[1], 20.0)]))
+
+        self.assertEqual(first.state, 'failed')
+        self.assertTrue(first.error_message)
+        self.assertEqual(second.state, 'review')
+        self.assertEqual(second.total_amount, 20.0)
+
+    def test_oversized_batch_is_split(self):
+        records = self._pending(3)
+
+        def respond(names):
+            if len(names) > 1:
+                return FakeResponse([], status_code=413)
+            record_id = int(names[0][len('receipt-'):-len('.jpg')])
+            return FakeResponse([ocr_result(names[0], float(record_id))])
+
+        requests = self._process(records, respond)
+
+        self.assertEqual([len(names) for names in requests], [3, 1, 2, 1, 1])
+        self.assertEqual(records.mapped('state'), ['review'] * 3)
+        self.assertEqual(records.mapped('total_amount'), [float(record.id) for record in records])
+
+    def test_batch_is_capped_by_image_bytes(self):
+        records = self._pending(3)
+        size = records._image_attachments()[records[0].id].file_size
+
+        self.assertEqual(records._leading_within_bytes(size), records[:1])
+        self.assertEqual(records._leading_within_bytes(0), records[:1])
+        self.assertEqual(records._leading_within_bytes(10 * size), records)
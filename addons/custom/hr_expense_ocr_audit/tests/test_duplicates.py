@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+from PIL import Image, ImageDraw
+
+from odoo.tests import TransactionCase, tagged
+
+OCR_RESULT = {
+    'success': True,
+    'confidence': 0.97,
+    'needs_review': False,
+    'raw_text': ['PETRON', '25/07/2025', 'TOTAL 2,499.41'],
+    'extracted_fields': {
+        'merchant': 'PETRON',
+        'date': '2025-07-25',
+        'total_amount': 2499.41,
+        'currency': 'PHP',
+    },
+}
+
+
+def receipt_png():
+    """A small receipt-like PNG with enough structure to hash"""
+    image = Image.new('L', (120, 240), 255)
+    draw = ImageDraw.Draw(image)
+    for row in range(10, 230, 18):
+        draw.rectangle((10, row, 40 + (row * 7) % 70, row + 8), fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@tagged('post_install', '-at_install')
+class TestDuplicateDetection(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.employee = cls.env['hr.employee'].create({'name': 'Receipt Tester'})
+        cls.receipt = receipt_png()
+
+    def _expense_with_receipt(self, name):
+        expense = self.env['hr.expense'].create({
+            'name': name,
+            'employee_id': self.employee.id,
+        })
+        self.env['ir.attachment'].create({
+            'name': 'receipt.png',
+            'res_model': 'hr.expense',
+            'res_id': expense.id,
+            'raw': self.receipt,
+            'mimetype': 'image/png',
+        })
+        return expense
+
+    def _run_ocr(self, expense):
+        """Queue OCR for an expense and apply a service result to it"""
+        ocr = expense._queue_ocr()
+        self.assertEqual(len(ocr), 1)
+        if ocr._check_duplicates():
+            ocr._process_ocr_result(OCR_RESULT)
+        return ocr
+
+    def test_reprocessing_an_expense_is_not_a_duplicate(self):
+        expense = self._expense_with_receipt('Fuel')
+        first = self._run_ocr(expense)
+        second = self._run_ocr(expense)
+
+        self.assertEqual(first.image_hash, second.image_hash)
+        self.assertFalse(second.duplicate_of_id)
+        self.assertFalse(second.duplicate_reason)
+        self.assertEqual(second.state, 'done')
+        self.assertEqual(expense.ocr_record_id, second)
+
+    def test_same_file_on_another_expense_is_a_duplicate(self):
+        first = self._run_ocr(self._expense_with_receipt('Fuel'))
+        other = self._expense_with_receipt('Fuel again')
+        second = self._run_ocr(other)
+
+        self.assertEqual(second.duplicate_of_id, first)
+        self.assertEqual(second.duplicate_reason, 'exact')
+        self.assertEqual(second.state, 'review')
+        self.assertFalse(other.ocr_record_id)
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the OCR service pipeline
+
+Run from docker/ocr, e.g. `python -m bench.run` for the full suite or
+`python -m bench.crop` / `python -m bench.deskew` / `python -m bench.extraction`
+for single stages
+"""
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Receipt Crop Benchmark
+Measures find_receipt/crop_to_quad on synthetic phone photos: how often
+the receipt is found, how well the corners match, how many pixels the
+later stages are spared, and how rarely clean scans are cropped by mistake
+
+Usage (from docker/ocr):
+    python -m bench.crop [--count 60] [--json out.json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from bench.synthetic import photograph, render_receipt
+from preprocess import crop_to_quad, find_receipt
+
+
+def run(count: int, seed: int) -> dict:
+    """
+    Run receipt detection on photographed and full-frame receipts
+
+    Returns:
+        Detection rate, corner error (as a fraction of the receipt
+        height), remaining pixel fraction, false crops and timing
+    """
+    found = 0
+    false_crops = 0
+    corner_errors = []
+    pixel_fractions = []
+    timings = []
+
+    for index in range(count):
+        receipt, _ = render_receipt(seed=seed + index, width=900)
+        photo, corners = photograph(receipt, seed=seed + index,
+                                    coverage=0.4 + 0.4 * (index % 5) / 4)
+        gray = cv2.cvtColor(photo, cv2.COLOR_BGR2GRAY)
+
+        started = time.perf_counter()
+        quad = find_receipt(gray)
+        if quad is not None:
+            cropped = crop_to_quad(gray, quad)
+        timings.append((time.perf_counter() - started) * 1000)
+
+        if quad is not None:
+            found += 1
+            height = np.linalg.norm(corners[3] - corners[0])
+            corner_errors.append(float(np.linalg.norm(quad - corners, axis=1).max() / height))
+            pixel_fractions.append(cropped.size / gray.size)
+
+        # A receipt that already fills the frame must be left alone
+        if find_receipt(cv2.cvtColor(receipt, cv2.COLOR_BGR2GRAY)) is not None:
+            false_crops += 1
+
+    return {
+        'count': count,
+        'detection_rate': round(found / count, 3),
+        'false_crop_rate': round(false_crops / count, 3),
+        'mean_corner_error': round(statistics.mean(corner_errors), 4) if corner_errors else None,
+        'max_corner_error': round(max(corner_errors), 4) if corner_errors else None,
+        'mean_pixel_fraction': (round(statistics.mean(pixel_fractions), 3)
+                                if pixel_fractions else None),
+        'mean_ms': round(statistics.mean(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=60, help='Synthetic photos to generate')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    report = run(args.count, args.seed)
+    for name, value in report.items():
+        print(f"{name:<20} {value}")
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Deskew Benchmark
+Compares the original full-resolution Hough skew estimate with the
+downsampled text-line estimate used by deskew_image
+
+Usage (from docker/ocr):
+    python -m bench.deskew [--count 60] [--width 1200] [--json out.json]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+from bench.synthetic import render_receipt
+from preprocess import downsample, estimate_skew
+
+
+def hough_skew(image: np.ndarray, max_angle: float = 10.0) -> float:
+    """
+    Original deskew_image angle estimate (Canny + HoughLines at full
+    resolution, Python loop over lines), kept as the baseline
+    """
+    edges = cv2.Canny(image, 50, 150, apertureSize=3)
+    lines = cv2.HoughLines(edges, 1, np.pi / 180, 200)
+    if lines is None:
+        return 0.0
+
+    angles = []
+    for rho, theta in lines[:, 0]:
+        angle = np.degrees(theta) - 90
+        if -max_angle <= angle <= max_angle:
+            angles.append(angle)
+
+    if not angles:
+        return 0.0
+    return float(np.median(angles))
+
+
+def proxy_skew(image: np.ndarray, max_angle: float = 10.0) -> float:
+    """Current deskew_image angle estimate"""
+    return estimate_skew(downsample(image), max_angle=max_angle)
+
+
+METHODS = {
+    'hough_full_res': hough_skew,
+    'text_lines_proxy': proxy_skew,
+}
+
+
+def run(count: int, width: int, max_rotation: float, seed: int) -> dict:
+    """
+    Estimate skew on a synthetic rotated-receipt set with every method
+
+    Returns:
+        Per-method accuracy (absolute residual error in degrees) and timing
+    """
+    rng = random.Random(seed)
+    samples = []
+    for index in range(count):
+        rotation = round(rng.uniform(-max_rotation, max_rotation), 2)
+        image, _ = render_receipt(seed=seed + index, width=width, rotation=rotation,
+                                  noise=rng.choice([0, 0, 8, 15]))
+        samples.append((cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), rotation))
+
+    report = {'count': count, 'width': width, 'max_rotation': max_rotation, 'methods': {}}
+    for name, method in METHODS.items():
+        errors = []
+        timings = []
+        for gray, rotation in samples:
+            started = time.perf_counter()
+            estimate = method(gray)
+            timings.append((time.perf_counter() - started) * 1000)
+            # A correct estimate undoes the applied rotation
+            errors.append(abs(estimate + rotation))
+
+        report['methods'][name] = {
+            'mean_abs_error_deg': round(statistics.mean(errors), 3),
+            'p95_abs_error_deg': round(sorted(errors)[int(0.95 * (len(errors) - 1))], 3),
+            'within_0_5_deg': round(sum(error <= 0.5 for error in errors) / len(errors), 3),
+            'mean_ms': round(statistics.mean(timings), 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=60, help='Synthetic receipts to generate')
+    parser.add_argument('--width', type=int, default=1200, help='Receipt width in pixels')
+    parser.add_argument('--max-rotation', type=float, default=8.0,
+                        help='Maximum applied rotation (degrees)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    report = run(args.count, args.width, args.max_rotation, args.seed)
+
+    print(f"{'method':<18} {'mean err':>9} {'p95 err':>8} {'<=0.5deg':>9} {'mean ms':>8}")
+    for name, result in report['methods'].items():
+        print(f"{name:<18} {result['mean_abs_error_deg']:>9.3f} "
+              f"{result['p95_abs_error_deg']:>8.3f} "
+              f"{result['within_0_5_deg']:>9.1%} {result['mean_ms']:>8.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
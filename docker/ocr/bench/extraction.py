@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Field Extraction Benchmark
+Compares the original first-match regex extraction with the ranking
+extractor on OCR text dumps: accuracy per field and cost per receipt
+
+Usage (from docker/ocr):
+    python -m bench.extraction [--synthetic 500] [--repeat 20] [--json out.json]
+
+The corpus is bench/corpus/*.jsonl (one {"lines": [...], "truth": {...}}
+object per line, optionally with the "rules" set to extract with) plus
+synthetic receipts from bench.synthetic. Dates are compared as ISO dates.
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import statistics
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bench.synthetic import receipt_lines
+from extraction import RuleRegistry, extract_fields
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+FIELDS = ('merchant', 'date', 'total_amount', 'tax_amount', 'currency')
+
+# Patterns and logic of the original app.extract_fields, kept as baseline
+LEGACY_PATTERNS = {
+    'total': [
+        r'total[:\s]+[$£€]?\s*(\d+[.,]\d{2})',
+        r'amount due[:\s]+[$£€]?\s*(\d+[.,]\d{2})',
+        r'balance[:\s]+[$£€]?\s*(\d+[.,]\d{2})',
+    ],
+    'date': [
+        r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
+        r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},?\s+\d{4}',
+    ],
+    'merchant': [
+        r'^([A-Z][A-Za-z\s&]+)$',
+    ],
+    'tax': [
+        r'tax[:\s]+[$£€]?\s*(\d+[.,]\d{2})',
+        r'vat[:\s]+[$£€]?\s*(\d+[.,]\d{2})',
+        r'gst[:\s]+[$£€]?\s*(\d+[.,]\d{2})',
+    ],
+}
+
+
+def legacy_extract_fields(lines: List[str], rules: Optional[str] = None) -> Dict:
+    """Original app.extract_fields"""
+    full_text = '\n'.join(lines)
+    fields = {}
+
+    for pattern in LEGACY_PATTERNS['total']:
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            try:
+                fields['total_amount'] = float(match.group(1).replace(',', ''))
+                break
+            except ValueError:
+                pass
+
+    for pattern in LEGACY_PATTERNS['date']:
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            fields['date'] = match.group(1)
+            break
+
+    for line in lines[:5]:
+        for pattern in LEGACY_PATTERNS['merchant']:
+            match = re.match(pattern, line.strip())
+            if match and len(match.group(1)) > 3:
+                fields['merchant'] = match.group(1)
+                break
+        if 'merchant' in fields:
+            break
+
+    for pattern in LEGACY_PATTERNS['tax']:
+        match = re.search(pattern, full_text, re.IGNORECASE)
+        if match:
+            try:
+                fields['tax_amount'] = float(match.group(1).replace(',', ''))
+                break
+            except ValueError:
+                pass
+
+    for symbol, code in {'$': 'USD', '£': 'GBP', '€': 'EUR', '¥': 'JPY', '₹': 'INR'}.items():
+        if symbol in full_text:
+            fields['currency'] = code
+            break
+    if 'currency' not in fields:
+        fields['currency'] = 'USD'
+
+    return fields
+
+
+registry = RuleRegistry()
+
+
+def rules_extract_fields(lines: List[str], rules: Optional[str] = None) -> Dict:
+    """Candidate-ranking extraction with the receipt's locale/vendor rule set"""
+    return extract_fields(lines, rules=registry.select(lines, rules))
+
+
+METHODS = {
+    'legacy_regex': legacy_extract_fields,
+    'ranked': rules_extract_fields,
+}
+
+
+def iso_date(value: Optional[str]) -> Optional[str]:
+    """Normalize the legacy output formats (mm/dd/yyyy, Mon d, yyyy) to YYYY-MM-DD"""
+    for fmt in ('%m/%d/%Y', '%b %d, %Y'):
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+def load_corpus(synthetic: int, seed: int) -> List[Dict]:
+    """Load text dumps from CORPUS_DIR and add synthetic receipts"""
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.jsonl'))):
+        with open(path, encoding='utf-8') as handle:
+            corpus.extend(json.loads(line) for line in handle if line.strip())
+
+    rng = random.Random(seed)
+    for _ in range(synthetic):
+        lines, truth = receipt_lines(rng, rng.randint(3, 25))
+        corpus.append({'lines': lines, 'truth': truth})
+    return corpus
+
+
+def accuracy(method, corpus: List[Dict]) -> Dict[str, float]:
+    """Share of receipts where each ground-truth field was extracted exactly"""
+    scores = {}
+    for field in FIELDS:
+        relevant = [item for item in corpus if field in item['truth']]
+        if relevant:
+            normalize = iso_date if field == 'date' else (lambda value: value)
+            correct = sum(
+                normalize(method(item['lines'], item.get('rules')).get(field))
+                == normalize(item['truth'][field])
+                for item in relevant
+            )
+            scores[field] = round(correct / len(relevant), 3)
+    return scores
+
+
+def run(synthetic: int, repeat: int, seed: int) -> Dict:
+    """Time and score every method on the corpus"""
+    corpus = load_corpus(synthetic, seed)
+    report = {'receipts': len(corpus), 'repeat': repeat, 'methods': {}}
+
+    for name, method in METHODS.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for item in corpus:
+                method(item['lines'], item.get('rules'))
+            timings.append((time.perf_counter() - started) / len(corpus) * 1e6)
+
+        report['methods'][name] = {
+            'us_per_receipt': round(statistics.median(timings), 2),
+            'accuracy': accuracy(method, corpus),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, default=500,
+                        help='Synthetic receipts added to the corpus')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Timing repetitions (median reported)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='Write the report to this file')
+    args = parser.parse_args()
+
+    report = run(args.synthetic, args.repeat, args.seed)
+
+    print(f"{report['receipts']} receipts")
+    print(f"{'method':<14} {'us/receipt':>10}  " + ' '.join(f"{field:>12}" for field in FIELDS))
+    for name, result in report['methods'].items():
+        scores = ' '.join(f"{result['accuracy'].get(field, 0):>12.1%}" for field in FIELDS)
+        print(f"{name:<14} {result['us_per_receipt']:>10.2f}  {scores}")
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Receipt Pipeline Benchmark
+Drives decoding and preprocessing, field extraction and the /v1/parse
+endpoint with synthetic receipts and reports throughput, latency
+percentiles, peak RSS and extraction accuracy
+
+Usage (from docker/ocr):
+    python -m bench.run [--suites preprocess,extract,parse,backends] [--count 40]
+                        [--concurrency 4] [--url http://localhost:8000]
+                        [--json out.json] [--compare baseline.json]
+
+Suites:
+    preprocess  decode_image + preprocess_array for every pipeline mode
+    extract     field extraction over bench/corpus plus synthetic text
+    parse       POST /v1/parse with `--concurrency` parallel clients;
+                against --url if given, otherwise against the app served
+                in-process (needs the full OCR dependencies)
+    backends    OCR of preprocessed receipts on each `--backends` engine
+                (paddle, onnx) in a fresh process, with peak RSS, mean
+                line confidence, field accuracy and text agreement with
+                the first backend; not run by default (needs the baked
+                models and ONNX exports, i.e. the container)
+
+Synthetic receipts vary in width (600-2400px), rotation, noise and blur.
+Upload bytes get a per-run suffix so the result cache does not serve
+repeats (--allow-cache to measure cache hits instead).
+
+--compare exits with status 1 if a latency/RSS metric grew or a
+throughput/accuracy metric dropped by more than --tolerance.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bench.extraction import FIELDS, accuracy, iso_date, load_corpus, rules_extract_fields
+from bench.synthetic import encode, render_receipt
+
+SUITES = ('preprocess', 'extract', 'parse', 'backends')
+DEFAULT_SUITES = ('preprocess', 'extract', 'parse')
+
+WIDTHS = (600, 900, 1200, 1800, 2400)
+
+# Metrics checked by --compare: +1 if larger is worse, -1 if smaller is worse
+COMPARED = {
+    'p50_ms': 1,
+    'p95_ms': 1,
+    'p99_ms': 1,
+    'throughput_per_s': -1,
+    'peak_rss_mb': 1,
+    'pss_mb': 1,
+    'mean_confidence': -1,
+}
+
+# Accuracy may drop by at most this much (absolute) before it counts as a regression
+ACCURACY_TOLERANCE = 0.01
+
+
+def make_receipts(count: int, seed: int) -> List[Dict]:
+    """
+    Render synthetic receipt uploads
+
+    Returns:
+        Dicts with 'contents' (JPEG bytes), 'truth' and the render settings
+    """
+    rng = random.Random(seed)
+    receipts = []
+    for index in range(count):
+        settings = {
+            'width': rng.choice(WIDTHS),
+            'rotation': round(rng.uniform(-6, 6), 1),
+            'noise': rng.choice([0, 0, 8, 15]),
+            'blur': rng.choice([0, 0, 3]),
+        }
+        image, truth = render_receipt(seed=seed + index, **settings)
+        receipts.append({'contents': encode(image), 'truth': truth, **settings})
+    return receipts
+
+
+def summarize(latencies_ms: List[float], wall_seconds: float) -> Dict:
+    """
+    Latency percentiles (nearest rank) and throughput
+
+    Args:
+        latencies_ms: Per-operation latencies
+        wall_seconds: Wall-clock time for all operations
+    """
+    ordered = sorted(latencies_ms)
+
+    def percentile(p: float) -> float:
+        return round(ordered[max(0, math.ceil(p * len(ordered)) - 1)], 2)
+
+    return {
+        'count': len(ordered),
+        'throughput_per_s': round(len(ordered) / wall_seconds, 2) if wall_seconds else 0.0,
+        'mean_ms': round(statistics.mean(ordered), 2),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def process_tree(pid: int) -> List[int]:
+    """A process and all its live descendants, from /proc"""
+    pids = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/task/{current}/children') as handle:
+                pending.extend(int(child) for child in handle.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        pids.append(current)
+    return pids
+
+
+def peak_rss_mb(pid: Optional[int] = None) -> float:
+    """
+    Peak resident memory of a process and all its descendants
+
+    Uses VmHWM from /proc (summed over the process tree, so inference
+    workers are included); falls back to getrusage outside Linux. Pages
+    shared between workers are counted once per worker, see pss_mb().
+    """
+    pid = pid or os.getpid()
+    if not os.path.exists(f'/proc/{pid}/status'):
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    total_kb = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/status') as handle:
+                for line in handle:
+                    if line.startswith('VmHWM:'):
+                        total_kb += int(line.split()[1])
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def pss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Current proportional set size of a process and all its descendants
+
+    Shared pages are split between the processes mapping them, so unlike
+    peak_rss_mb() this shows the saving of copy-on-write model sharing
+    (OCR_SHARED_MODELS). None outside Linux.
+    """
+    pid = pid or os.getpid()
+    if not os.path.exists(f'/proc/{pid}/smaps_rollup'):
+        return None
+
+    total_kb = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/smaps_rollup') as handle:
+                for line in handle:
+                    if line.startswith('Pss:'):
+                        total_kb += int(line.split()[1])
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def run_preprocess(receipts: List[Dict]) -> Dict[str, Dict]:
+    """Time decode plus preprocessing of every receipt for each pipeline mode"""
+    from preprocess import PIPELINE_MODES, decode_image, preprocess_array
+
+    results = {}
+    for pipeline in PIPELINE_MODES:
+        latencies = []
+        wall_started = time.perf_counter()
+        for receipt in receipts:
+            started = time.perf_counter()
+            preprocess_array(decode_image(receipt['contents'])[0], pipeline=pipeline)
+            latencies.append((time.perf_counter() - started) * 1000)
+        results[f'preprocess:{pipeline}'] = {
+            **summarize(latencies, time.perf_counter() - wall_started),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    return results
+
+
+def run_extract(synthetic: int, seed: int) -> Dict[str, Dict]:
+    """Time field extraction and score it against the text corpus"""
+    corpus = load_corpus(synthetic, seed)
+    latencies = []
+    wall_started = time.perf_counter()
+    for item in corpus:
+        started = time.perf_counter()
+        rules_extract_fields(item['lines'], item.get('rules'))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return {'extract': {
+        **summarize(latencies, time.perf_counter() - wall_started),
+        'accuracy': accuracy(rules_extract_fields, corpus),
+    }}
+
+
+def multipart(filename: str, contents: bytes,
+              content_type: str = 'image/jpeg') -> Tuple[bytes, str]:
+    """Encode a single-file multipart/form-data body"""
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'.encode(),
+        contents,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def post_receipt(url: str, api_key: str, pipeline: str, index: int,
+                 contents: bytes, timeout: float) -> Tuple[int, float, Optional[Dict]]:
+    """
+    POST one receipt to /v1/parse
+
+    Returns:
+        (status code, latency in ms, response JSON or None)
+    """
+    body, content_type = multipart(f'receipt-{index}.jpg', contents)
+    request = urllib.request.Request(
+        f'{url}/v1/parse?pipeline={pipeline}', data=body, method='POST',
+        headers={'Content-Type': content_type, 'X-API-Key': api_key},
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+            return response.status, (time.perf_counter() - started) * 1000, payload
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, (time.perf_counter() - started) * 1000, None
+    except (urllib.error.URLError, TimeoutError):
+        return 0, (time.perf_counter() - started) * 1000, None
+
+
+def serve_in_process():
+    """
+    Serve app.app on a free local port from a background thread
+
+    Returns:
+        (uvicorn server, thread, base URL)
+    """
+    import uvicorn
+    from app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=0, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("In-process OCR server failed to start")
+        time.sleep(0.05)
+
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f'http://127.0.0.1:{port}'
+
+
+def score_fields(extracted: Dict, truth: Dict) -> Dict[str, bool]:
+    """Per-field exact match of an OCR response against the synthetic truth"""
+    return {
+        field: (iso_date(extracted.get(field)) if field == 'date' else extracted.get(field))
+        == (iso_date(truth[field]) if field == 'date' else truth[field])
+        for field in FIELDS
+    }
+
+
+def run_parse(receipts: List[Dict], url: Optional[str], api_key: str, pipeline: str,
+              concurrency: int, allow_cache: bool, timeout: float) -> Dict[str, Dict]:
+    """Drive /v1/parse with concurrent clients"""
+    server = None
+    if not url:
+        server, thread, url = serve_in_process()
+
+    nonce = b'' if allow_cache else uuid.uuid4().bytes
+    try:
+        # One untimed request so model loading is not measured
+        post_receipt(url, api_key, pipeline, -1, receipts[0]['contents'] + uuid.uuid4().bytes,
+                     timeout)
+
+        wall_started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            responses = list(executor.map(
+                lambda item: post_receipt(url, api_key, pipeline, item[0],
+                                          item[1]['contents'] + nonce, timeout),
+                enumerate(receipts)
+            ))
+        wall_seconds = time.perf_counter() - wall_started
+        rss = peak_rss_mb() if server else None
+        pss = pss_mb() if server else None
+    finally:
+        if server:
+            server.should_exit = True
+            thread.join(timeout=30)
+
+    ok = [(latency, payload) for status, latency, payload in responses if status == 200]
+    statuses = {}
+    for status, _, _ in responses:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    scores = [
+        score_fields(payload.get('extracted_fields', {}), receipt['truth'])
+        for (status, _, payload), receipt in zip(responses, receipts) if status == 200
+    ]
+    field_accuracy = {
+        field: round(sum(score[field] for score in scores) / len(scores), 3)
+        for field in FIELDS
+    } if scores else {}
+
+    result = summarize([latency for latency, _ in ok], wall_seconds) if ok else {'count': 0}
+    result.update({
+        'concurrency': concurrency,
+        'pipeline': pipeline,
+        'statuses': statuses,
+        'error_rate': round(1 - len(ok) / len(responses), 3),
+        'peak_rss_mb': rss,
+        'pss_mb': pss,
+        'accuracy': field_accuracy,
+    })
+    return {'parse': result}
+
+
+def time_backend(backend: str, images: List) -> Dict:
+    """
+    OCR preprocessed images one at a time on a freshly built engine
+
+    Runs in its own process so peak RSS covers this backend only.
+
+    Returns:
+        'latencies_ms', 'wall_seconds', per-image 'lines' and 'peak_rss_mb'
+    """
+    from engine import create_engine, ocr_images
+
+    engine = create_engine(backend)
+    ocr_images(engine, images[:1])  # untimed, so lazy setup is not measured
+
+    latencies = []
+    lines = []
+    wall_started = time.perf_counter()
+    for image in images:
+        started = time.perf_counter()
+        lines.extend(ocr_images(engine, [image]))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        'latencies_ms': latencies,
+        'wall_seconds': time.perf_counter() - wall_started,
+        'lines': lines,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_backends(receipts: List[Dict], backends: List[str], pipeline: str) -> Dict[str, Dict]:
+    """Compare OCR backends on the same preprocessed receipts"""
+    from extraction import extract_fields
+    from preprocess import decode_image, preprocess_array
+
+    images = [
+        preprocess_array(decode_image(receipt['contents'])[0], pipeline=pipeline)
+        for receipt in receipts
+    ]
+
+    results = {}
+    reference = None
+    for backend in backends:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            timed = executor.submit(time_backend, backend, images).result()
+
+        confidences = [confidence for lines in timed['lines'] for _, confidence in lines]
+        scores = [
+            score_fields(extract_fields([text for text, _ in lines],
+                                        [confidence for _, confidence in lines]),
+                         receipt['truth'])
+            for lines, receipt in zip(timed['lines'], receipts)
+        ]
+        texts = [{text for text, _ in lines} for lines in timed['lines']]
+        if reference is None:
+            reference = texts
+
+        results[f'backend:{backend}'] = {
+            **summarize(timed['latencies_ms'], timed['wall_seconds']),
+            'peak_rss_mb': timed['peak_rss_mb'],
+            'mean_confidence': round(statistics.mean(confidences), 4) if confidences else 0.0,
+            # Share of the first backend's lines read identically
+            'text_agreement': round(
+                sum(len(ours & theirs) for ours, theirs in zip(texts, reference))
+                / max(1, sum(len(theirs) for theirs in reference)), 3
+            ),
+            'accuracy': {
+                field: round(sum(score[field] for score in scores) / len(scores), 3)
+                for field in FIELDS
+            } if scores else {},
+        }
+    return results
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compare two reports suite by suite
+
+    Returns:
+        Human-readable regressions (empty if none)
+    """
+    regressions = []
+    print(f"\n{'suite':<22} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for suite, metrics in current['suites'].items():
+        previous = baseline.get('suites', {}).get(suite)
+        if not previous:
+            continue
+
+        for metric, direction in COMPARED.items():
+            old, new = previous.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ' !' if change * direction > tolerance else ''
+            print(f"{suite:<22} {metric:<22} {old:>10.2f} {new:>10.2f} {change:>+8.1%}{flag}")
+            if flag:
+                regressions.append(f"{suite} {metric}: {old} -> {new} ({change:+.1%})")
+
+        for field, old in previous.get('accuracy', {}).items():
+            new = metrics.get('accuracy', {}).get(field)
+            if new is not None and old - new > ACCURACY_TOLERANCE:
+                print(f"{suite:<22} {'accuracy:' + field:<22} {old:>10.3f} {new:>10.3f} "
+                      f"{new - old:>+8.3f} !")
+                regressions.append(f"{suite} accuracy {field}: {old} -> {new}")
+    return regressions
+
+
+def print_report(report: Dict):
+    """Print one line per suite"""
+    print(f"{'suite':<22} {'count':>6} {'per s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'rss MB':>8}")
+    for suite, metrics in report['suites'].items():
+        if not metrics.get('count'):
+            print(f"{suite:<22} {'no successful operations':>30} {metrics.get('statuses', '')}")
+            continue
+        rss = metrics.get('peak_rss_mb')
+        print(f"{suite:<22} {metrics['count']:>6} {metrics['throughput_per_s']:>8.2f} "
+              f"{metrics['p50_ms']:>9.2f} {metrics['p95_ms']:>9.2f} {metrics['p99_ms']:>9.2f} "
+              f"{rss if rss is not None else '-':>8}")
+        if 'mean_confidence' in metrics:
+            print(f"{'':<22} confidence {metrics['mean_confidence']:.3f}, "
+                  f"text agreement {metrics['text_agreement']:.1%}")
+        if metrics.get('accuracy'):
+            scores = ', '.join(f"{field}={score:.1%}"
+                               for field, score in metrics['accuracy'].items())
+            print(f"{'':<22} accuracy {scores}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', default=','.join(DEFAULT_SUITES),
+                        help=f"Comma-separated suites to run ({', '.join(SUITES)})")
+    parser.add_argument('--count', type=int, default=40, help='Synthetic receipt images')
+    parser.add_argument('--synthetic-text', type=int, default=500,
+                        help='Synthetic text receipts for extract')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--url',
+                        help='OCR service base URL (parse suite runs in-process if omitted)')
+    parser.add_argument('--api-key', default=os.environ.get('OCR_API_KEY', ''))
+    parser.add_argument('--pipeline', default='standard', help='Pipeline for the parse suite')
+    parser.add_argument('--backends', default='paddle,onnx', help='Engines for the backends suite')
+    parser.add_argument('--concurrency', type=int, default=4, help='Parallel /v1/parse clients')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-request timeout in seconds')
+    parser.add_argument('--allow-cache', action='store_true',
+                        help='Let the result cache serve repeated runs')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--compare', help='Baseline report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative change')
+    args = parser.parse_args()
+
+    suites = [suite.strip() for suite in args.suites.split(',') if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    report = {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'suites': {},
+    }
+
+    needs_images = {'preprocess', 'parse', 'backends'} & set(suites)
+    receipts = make_receipts(args.count, args.seed) if needs_images else []
+    if 'preprocess' in suites:
+        report['suites'].update(run_preprocess(receipts))
+    if 'extract' in suites:
+        report['suites'].update(run_extract(args.synthetic_text, args.seed))
+    if 'parse' in suites:
+        report['suites'].update(run_parse(receipts, args.url, args.api_key, args.pipeline,
+                                          args.concurrency, args.allow_cache, args.timeout))
+    if 'backends' in suites:
+        report['suites'].update(run_backends(receipts, args.backends.split(','), args.pipeline))
+
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(report, json.load(handle), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Synthetic Receipt Generator
+Renders receipt-like images with known content for benchmarks
+"""
+
+import random
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+MERCHANTS = [
+    'STARBUCKS', 'JOLLIBEE', 'SHELL SELECT', 'SEVEN ELEVEN', 'MERCURY DRUG',
+    'SM SUPERMARKET', 'PUREGOLD', 'GRAB FOOD', 'NATIONAL BOOK STORE', 'PETRON',
+]
+
+ITEMS = [
+    'COFFEE', 'SANDWICH', 'WATER', 'UNLEADED 95', 'RICE MEAL', 'NOTEBOOK',
+    'PAPER TOWEL', 'BATTERIES', 'TOLL FEE', 'PARKING', 'SNACKS', 'PRINTING',
+]
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def receipt_lines(rng: random.Random, item_count: int) -> Tuple[List[str], Dict]:
+    """
+    Build the text lines of a receipt and its ground truth fields
+
+    Args:
+        rng: Random source
+        item_count: Number of line items
+
+    Returns:
+        (lines, truth) where truth holds merchant, date, total_amount,
+        tax_amount and currency
+    """
+    merchant = rng.choice(MERCHANTS)
+    date = f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2025"
+
+    lines = [merchant, f"{rng.randint(1, 999)} MAIN STREET", f"DATE {date}", '']
+    subtotal = 0.0
+    for _ in range(item_count):
+        price = round(rng.uniform(1, 80), 2)
+        subtotal += price
+        lines.append(f"{rng.choice(ITEMS):<16} {price:>8.2f}")
+
+    tax = round(subtotal * 0.08, 2)
+    total = round(subtotal + tax, 2)
+    lines += [
+        '',
+        f"SUBTOTAL {subtotal:>12.2f}",
+        f"TAX {tax:>17.2f}",
+        f"TOTAL ${total:.2f}",
+        'THANK YOU',
+    ]
+
+    truth = {
+        'merchant': merchant,
+        'date': date,
+        'total_amount': total,
+        'tax_amount': tax,
+        'currency': 'USD',
+    }
+    return lines, truth
+
+
+def render_receipt(seed: int = 0, width: int = 600, item_count: Optional[int] = None,
+                   rotation: float = 0.0, noise: float = 0.0, blur: int = 0,
+                   ) -> Tuple[np.ndarray, Dict]:
+    """
+    Render a synthetic receipt
+
+    Args:
+        seed: Random seed (same seed, same receipt)
+        width: Image width in pixels; text scales with it
+        item_count: Number of line items (random 3-15 if None)
+        rotation: Counter-clockwise rotation in degrees
+        noise: Gaussian noise standard deviation
+        blur: Gaussian blur kernel size (0 disables, must be odd)
+
+    Returns:
+        (BGR image array, truth dict); truth also holds 'lines' and the
+        applied 'rotation'
+    """
+    rng = random.Random(seed)
+    if item_count is None:
+        item_count = rng.randint(3, 15)
+
+    lines, truth = receipt_lines(rng, item_count)
+
+    scale = width / 600
+    font_scale = 0.8 * scale
+    thickness = max(1, int(round(2 * scale)))
+    line_height = int(36 * scale)
+    margin = int(30 * scale)
+    height = margin * 2 + line_height * len(lines)
+
+    image = np.full((height, width, 3), 248, dtype=np.uint8)
+    for index, text in enumerate(lines):
+        y = margin + line_height * (index + 1) - line_height // 4
+        cv2.putText(image, text, (margin, y), FONT, font_scale, (20, 20, 20), thickness,
+                    cv2.LINE_AA)
+
+    if rotation:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rotation, 1.0)
+        image = cv2.warpAffine(image, matrix, (width, height),
+                               flags=cv2.INTER_CUBIC, borderValue=(248, 248, 248))
+
+    if blur:
+        image = cv2.GaussianBlur(image, (blur, blur), 0)
+
+    if noise:
+        noisy = image.astype(np.float32) + np.random.default_rng(seed).normal(0, noise, image.shape)
+        image = np.clip(noisy, 0, 255).astype(np.uint8)
+
+    truth['lines'] = lines
+    truth['rotation'] = rotation
+    return image, truth
+
+
+def photograph(receipt: np.ndarray, seed: int = 0, frame: Tuple[int, int] = (1500, 2000),
+               coverage: float = 0.45, tilt: float = 0.06,
+               background: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Place a rendered receipt in a phone-photo-like frame
+
+    The receipt is perspective-warped onto a darker, textured "table"
+    with uneven lighting.
+
+    Args:
+        receipt: Receipt image from render_receipt()
+        seed: Random seed for placement, tilt and background
+        frame: Photo (width, height)
+        coverage: Approximate fraction of the frame height the receipt spans
+        tilt: Maximum corner displacement as a fraction of the receipt size
+        background: Table brightness (random 40-150 if None)
+
+    Returns:
+        (BGR photo, receipt corners as a 4x2 float array in tl, tr, br, bl order)
+    """
+    rng = np.random.default_rng(seed)
+    frame_width, frame_height = frame
+    height, width = receipt.shape[:2]
+
+    scale = coverage * frame_height / height
+    scale = min(scale, 0.9 * frame_width / width, 0.95 * frame_height / height)
+    target_width, target_height = width * scale, height * scale
+    left = rng.uniform(0.03, 0.97) * (frame_width - target_width)
+    top = rng.uniform(0.03, 0.97) * (frame_height - target_height)
+
+    corners = np.float32([
+        [left, top],
+        [left + target_width, top],
+        [left + target_width, top + target_height],
+        [left, top + target_height],
+    ])
+    jitter = rng.uniform(-tilt, tilt, (4, 2)).astype(np.float32)
+    corners += jitter * np.float32([target_width, target_height])
+    corners[:, 0] = np.clip(corners[:, 0], 0, frame_width - 1)
+    corners[:, 1] = np.clip(corners[:, 1], 0, frame_height - 1)
+
+    if background is None:
+        background = int(rng.integers(40, 150))
+    table = rng.normal(background, 12, (frame_height // 8 + 1, frame_width // 8 + 1))
+    table = cv2.resize(table.astype(np.float32), (frame_width, frame_height),
+                       interpolation=cv2.INTER_CUBIC)
+    photo = cv2.cvtColor(np.clip(table, 0, 255).astype(np.uint8), cv2.COLOR_GRAY2BGR)
+
+    source = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(source, corners)
+    cv2.warpPerspective(receipt, matrix, (frame_width, frame_height), dst=photo,
+                        flags=cv2.INTER_AREA, borderMode=cv2.BORDER_TRANSPARENT)
+
+    # Light falling off towards one corner
+    ys, xs = np.mgrid[0:frame_height, 0:frame_width].astype(np.float32)
+    shade = 1.0 - 0.25 * (xs / frame_width + ys / frame_height) / 2
+    photo = np.clip(photo * shade[..., None], 0, 255).astype(np.uint8)
+    return photo, corners
+
+
+def encode(image: np.ndarray, ext: str = '.jpg', quality: int = 90) -> bytes:
+    """
+    Encode an image array to file bytes as an upload would carry them
+
+    Args:
+        image: Image array
+        ext: Target format extension
+        quality: JPEG quality
+
+    Returns:
+        Encoded bytes
+    """
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext in ('.jpg', '.jpeg') else []
+    ok, buffer = cv2.imencode(ext, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    return buffer.tobytes()
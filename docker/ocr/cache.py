@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+OCR Result Cache
+Content-hash keyed cache with an in-memory LRU tier and an optional
+SQLite on-disk tier, so re-submitted receipts skip the OCR pipeline
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Entries kept in the in-memory LRU tier (0 disables it)
+CACHE_MEMORY_ITEMS = int(os.environ.get("OCR_CACHE_MEMORY_ITEMS", "512"))
+
+# SQLite file for the on-disk tier (empty disables it)
+CACHE_DISK_PATH = os.environ.get("OCR_CACHE_DISK_PATH", "")
+
+# Size budget of the on-disk tier; least recently used entries are evicted
+CACHE_DISK_MAX_BYTES = int(os.environ.get("OCR_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024
+
+
+def cache_key(contents: bytes, *parts: str) -> str:
+    """
+    Build a cache key from raw image bytes and pipeline identifiers
+
+    Args:
+        contents: Raw uploaded image bytes
+        parts: Pipeline/model version and any options affecting the result
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(contents)
+    for part in parts:
+        digest.update(b"\0" + str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier result cache
+
+    The memory tier is a bounded LRU; the optional disk tier is a SQLite
+    table evicted by least-recent access once it exceeds its byte budget.
+    Disk hits are promoted into the memory tier.
+    """
+
+    def __init__(self, memory_items: int = CACHE_MEMORY_ITEMS,
+                 disk_path: str = CACHE_DISK_PATH,
+                 disk_max_bytes: int = CACHE_DISK_MAX_BYTES):
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, path: str):
+        """Open (or create) the SQLite disk tier"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._disk_bytes = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        logger.info(f"OCR disk cache opened: {path} ({self._disk_bytes} bytes)")
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a cached result
+
+        Args:
+            key: Key from cache_key()
+
+        Returns:
+            Cached result dict, or None on miss
+        """
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?",
+                                     (time.time(), key))
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Dict):
+        """
+        Store a result in both tiers
+
+        Args:
+            key: Key from cache_key()
+            value: JSON-serializable result dict
+        """
+        with self._lock:
+            self._remember(key, value)
+
+            if self._db is not None:
+                payload = json.dumps(value)
+                size = len(payload)
+                previous = self._db.execute(
+                    "SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, payload, size, time.time())
+                )
+                self._disk_bytes += size - (previous[0] if previous else 0)
+                self._evict_disk()
+
+    def _remember(self, key: str, value: Dict):
+        """Insert into the memory LRU, dropping the oldest entries"""
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Delete least recently used disk entries until under budget"""
+        while self._disk_bytes > self.disk_max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM entries ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+
+    def stats(self) -> Dict:
+        """Cache counters for health/monitoring endpoints"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes if self._db is not None else None,
+        }
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+OCR Engine Cascade
+First-pass engines and the confidence checks that decide whether a
+first-pass result is good enough or the receipt goes on to the full
+PaddleOCR pass. Kept free of OpenCV/NumPy so the API process can decide
+without loading the image stack
+"""
+
+import os
+from typing import Dict, Optional
+
+# Engines that produce results: the full-resolution PaddleOCR pass, and the
+# cheap first passes tried before it
+PADDLE = 'paddle'
+TESSERACT = 'tesseract'        # Tesseract on the preprocessed image, always binarized
+PADDLE_SMALL = 'paddle-small'  # PaddleOCR on a downscaled copy
+FIRST_PASS_ENGINES = (TESSERACT, PADDLE_SMALL)
+
+# First pass used by /v1/parse when the request does not pick one; "none"
+# sends every receipt straight to the full pass
+FIRST_PASS = os.environ.get("OCR_FIRST_PASS", "none")
+
+# Pixel budget of the paddle-small first pass (the full pass gets up to
+# OCR_MAX_IMAGE_MEGAPIXELS)
+FIRST_PASS_PIXELS = int(float(os.environ.get("OCR_FIRST_PASS_MEGAPIXELS", "1")) * 1_000_000)
+
+# A first-pass result is kept only if its mean line confidence reaches this...
+MIN_CONFIDENCE = float(os.environ.get("OCR_CASCADE_MIN_CONFIDENCE", "0.9"))
+
+# ...and every one of these fields was extracted with at least this confidence
+MIN_FIELD_CONFIDENCE = float(os.environ.get("OCR_CASCADE_MIN_FIELD_CONFIDENCE", "0.85"))
+REQUIRED_FIELDS = tuple(
+    field.strip()
+    for field in os.environ.get("OCR_CASCADE_FIELDS", "total_amount,date,merchant").split(",")
+    if field.strip()
+)
+
+
+def escalation_reason(response: Dict) -> Optional[str]:
+    """
+    Why a first-pass response is not good enough to return
+
+    Fields filled in by the rule set rather than read from the receipt
+    (a vendor's merchant on a requested vendor rule set, the default
+    currency) carry no field confidence and are not checked for one.
+
+    Args:
+        response: build_result() output of the first-pass result
+
+    Returns:
+        'no_text', 'confidence', 'missing:<field>' or
+        'field_confidence:<field>', or None to keep the result
+    """
+    if not response['line_count']:
+        return 'no_text'
+    if response['confidence'] < MIN_CONFIDENCE:
+        return 'confidence'
+    for field in REQUIRED_FIELDS:
+        if field not in response['extracted_fields']:
+            return f'missing:{field}'
+        if response['field_confidence'].get(field, 1.0) < MIN_FIELD_CONFIDENCE:
+            return f'field_confidence:{field}'
+    return None
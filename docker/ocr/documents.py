@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Multi-page Document Handling
+PDF and multi-frame TIFF detection, lazy page rasterization and merging
+of per-page extraction results
+"""
+
+import io
+import os
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+# Resolution PDF pages are rasterized at
+PDF_DPI = int(os.environ.get("OCR_PDF_DPI", "200"))
+
+# Rasterized page width cap, matching the preprocessing downscale limit
+PDF_MAX_WIDTH = 2000
+
+# Pages accepted per document
+DOCUMENT_MAX_PAGES = int(os.environ.get("OCR_DOCUMENT_MAX_PAGES", "50"))
+
+PDF = 'pdf'
+TIFF = 'tiff'
+
+
+def document_kind(contents: bytes) -> Optional[str]:
+    """
+    Identify multi-page documents from their leading bytes
+
+    Args:
+        contents: Raw uploaded bytes
+
+    Returns:
+        'pdf', 'tiff' for multi-frame TIFFs, or None for single images
+    """
+    if contents[:5] == b'%PDF-':
+        return PDF
+
+    if contents[:4] in (b'II*\x00', b'MM\x00*'):
+        with Image.open(io.BytesIO(contents)) as image:
+            if getattr(image, 'n_frames', 1) > 1:
+                return TIFF
+
+    return None
+
+
+def page_count(contents: bytes, kind: str) -> int:
+    """
+    Count pages without rasterizing any of them
+
+    Args:
+        contents: Raw document bytes
+        kind: 'pdf' or 'tiff'
+
+    Returns:
+        Number of pages
+    """
+    if kind == PDF:
+        import pypdfium2 as pdfium
+
+        document = pdfium.PdfDocument(contents)
+        try:
+            return len(document)
+        finally:
+            document.close()
+
+    with Image.open(io.BytesIO(contents)) as image:
+        return image.n_frames
+
+
+def load_page(contents: bytes, kind: str, index: int, dpi: int = PDF_DPI) -> Image.Image:
+    """
+    Rasterize a single page
+
+    Only the requested page is decoded, so a worker never holds more
+    than one rasterized page of a document.
+
+    Args:
+        contents: Raw document bytes
+        kind: 'pdf' or 'tiff'
+        index: Zero-based page index
+        dpi: PDF rasterization resolution
+
+    Returns:
+        PIL Image of the page; info['dpi'] holds the rendered resolution
+        for PDFs
+    """
+    if kind == PDF:
+        import pypdfium2 as pdfium
+
+        document = pdfium.PdfDocument(contents)
+        try:
+            page = document[index]
+            try:
+                # PDF user space is 72 points per inch
+                scale = min(dpi / 72, PDF_MAX_WIDTH / page.get_width())
+                image = page.render(scale=scale, grayscale=True).to_pil()
+                image.info['dpi'] = (72 * scale, 72 * scale)
+                return image
+            finally:
+                page.close()
+        finally:
+            document.close()
+
+    image = Image.open(io.BytesIO(contents))
+    image.seek(index)
+    return image.copy()
+
+
+def merge_pages(pages: List[Dict]) -> Dict:
+    """
+    Merge extracted fields from per-page results
+
+    Header fields (merchant, date) come from the first page that has
+    them; amounts (total, tax) and the currency that goes with them come
+    from the last page that has a total, since invoices total at the end.
+
+    Args:
+        pages: Per-page results (build_result() output) in page order
+
+    Returns:
+        Merged extracted_fields dict
+    """
+    fields = {}
+    for page in pages:
+        extracted = page.get('extracted_fields', {})
+        for name in ('merchant', 'date'):
+            if name in extracted and name not in fields:
+                fields[name] = extracted[name]
+
+    for page in reversed(pages):
+        extracted = page.get('extracted_fields', {})
+        if 'total_amount' in extracted:
+            fields['total_amount'] = extracted['total_amount']
+            fields['currency'] = extracted.get('currency', 'USD')
+            if 'tax_amount' in extracted:
+                fields['tax_amount'] = extracted['tax_amount']
+            break
+
+    if 'tax_amount' not in fields:
+        for page in reversed(pages):
+            if 'tax_amount' in page.get('extracted_fields', {}):
+                fields['tax_amount'] = page['extracted_fields']['tax_amount']
+                break
+
+    if 'currency' not in fields:
+        first = pages[0].get('extracted_fields', {}) if pages else {}
+        fields['currency'] = first.get('currency', 'USD')
+    return fields
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+OCR Engine Helpers
+PaddleOCR construction and cross-image batched detection/recognition,
+plus the Tesseract first-pass engine (see cascade.py)
+"""
+
+import copy
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+from paddleocr import PaddleOCR
+
+# Available once paddleocr has registered its bundled `tools` package
+from tools.infer.predict_system import sorted_boxes
+from tools.infer.utility import get_rotate_crop_image
+
+logger = logging.getLogger(__name__)
+
+# Recognition batch size; larger batches amortize per-call overhead when
+# crops from several receipts are stacked together
+REC_BATCH_NUM = int(os.environ.get("OCR_REC_BATCH_NUM", "16"))
+
+# CPU threads per engine; keep workers x threads within the container's CPU limit
+CPU_THREADS = int(os.environ.get("OCR_CPU_THREADS", "1"))
+
+# Directory holding the det/rec/cls inference models; the image bakes them
+# in at build time so workers never download on startup. Unset falls back
+# to PaddleOCR's per-user cache (~/.paddleocr).
+MODEL_DIR = os.environ.get("OCR_MODEL_DIR", "")
+
+MODEL_KINDS = ('det', 'rec', 'cls')
+
+# Inference backends: Paddle Inference on the Paddle models, or ONNX Runtime
+# on INT8-quantized exports of the same models (see export_onnx.py)
+PADDLE = 'paddle'
+ONNX = 'onnx'
+BACKENDS = (PADDLE, ONNX)
+
+# Tesseract page segmentation: --psm 4 reads a single column of text of
+# varying sizes, which is how receipts are laid out
+TESSERACT_CONFIG = os.environ.get("OCR_TESSERACT_CONFIG", "--oem 1 --psm 4")
+TESSERACT_LANG = os.environ.get("OCR_TESSERACT_LANG", "eng")
+
+# Text lines the angle classifier reads to decide whether a whole page is
+# upside down (see page_orientation)
+ORIENTATION_SAMPLES = int(os.environ.get("OCR_ORIENTATION_SAMPLES", "8"))
+
+# Below this page orientation confidence every text crop is classified
+# again on its own, as PaddleOCR does by default
+ORIENTATION_MIN_CONFIDENCE = float(os.environ.get("OCR_ORIENTATION_MIN_CONFIDENCE", "0.6"))
+
+
+def create_engine(backend: str = PADDLE) -> PaddleOCR:
+    """
+    Construct the PaddleOCR engine (CPU mode for cost efficiency)
+
+    Args:
+        backend: 'paddle' or 'onnx'; both expose the same detector,
+            classifier and recognizer, so ocr_images() works on either
+
+    Returns:
+        Configured PaddleOCR instance
+
+    Raises:
+        ValueError: For an unknown backend
+        FileNotFoundError: If the ONNX models have not been exported
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {backend}. Expected one of {', '.join(BACKENDS)}")
+
+    options = dict(
+        use_angle_cls=True,
+        lang='en',
+        use_gpu=False,
+        show_log=False,
+        rec_batch_num=REC_BATCH_NUM,
+        cpu_threads=CPU_THREADS,
+    )
+    if backend == PADDLE:
+        return PaddleOCR(
+            det_model_dir=_model_dir('det'),
+            rec_model_dir=_model_dir('rec'),
+            cls_model_dir=_model_dir('cls'),
+            **options
+        )
+
+    paths = {kind: onnx_model_path(kind) for kind in MODEL_KINDS}
+    for path in paths.values():
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX model not found: {path} (run export_onnx.py)")
+
+    engine = PaddleOCR(
+        use_onnx=True,
+        det_model_dir=paths['det'],
+        rec_model_dir=paths['rec'],
+        cls_model_dir=paths['cls'],
+        **options
+    )
+    _tune_onnx_sessions(engine, paths)
+    return engine
+
+
+def onnx_model_path(kind: str) -> str:
+    """Quantized ONNX export of a baked model, next to its Paddle files"""
+    return os.path.join(MODEL_DIR, kind, 'inference.int8.onnx')
+
+
+def _tune_onnx_sessions(engine: PaddleOCR, paths: Dict[str, str]):
+    """
+    Replace PaddleOCR's default ONNX sessions with tuned ones
+
+    PaddleOCR opens its sessions with default options, which size the
+    intra-op thread pool to every core of the host; with several workers
+    per container that oversubscribes the CPU limit.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = CPU_THREADS
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    for predictor, kind in ((engine.text_detector, 'det'),
+                            (engine.text_recognizer, 'rec'),
+                            (engine.text_classifier, 'cls')):
+        predictor.predictor = ort.InferenceSession(
+            paths[kind], options, providers=['CPUExecutionProvider']
+        )
+
+
+def _model_dir(kind: str) -> Optional[str]:
+    """
+    Paddle model directory for one of MODEL_KINDS
+
+    PaddleOCR downloads the default model into the directory if it does
+    not contain one yet.
+    """
+    return os.path.join(MODEL_DIR, kind) if MODEL_DIR else None
+
+
+def page_orientation(engine: PaddleOCR, image: np.ndarray) -> Tuple[np.ndarray, Dict]:
+    """
+    Turn an upside-down page upright with one small classifier call
+
+    The angle classifier reads the ORIENTATION_SAMPLES longest text lines
+    (preprocess.text_line_rects) and votes, weighted by its scores,
+    between upright and upside down. Receipts are printed one way up, so
+    one decision covers every line and the per-line classifier in
+    ocr_images() can be skipped when the vote is clear.
+
+    Args:
+        engine: PaddleOCR instance
+        image: Grayscale page with horizontal text (see
+            preprocess.rotate_sideways)
+
+    Returns:
+        (image, orientation) where orientation holds the clockwise
+        'angle' applied (0 or 180) and the vote 'confidence' (0-1; 0.0
+        when no text lines were found)
+    """
+    from preprocess import text_line_rects
+
+    rects = text_line_rects(image, ORIENTATION_SAMPLES) if engine.use_angle_cls else []
+    if not rects:
+        return image, {'angle': 0, 'confidence': 0.0}
+
+    crops = [cv2.cvtColor(image[y:y + h, x:x + w], cv2.COLOR_GRAY2BGR) for x, y, w, h in rects]
+    _, labels, _ = engine.text_classifier(crops)
+
+    upright = sum(score for label, score in labels if label == '0')
+    flipped = sum(score for label, score in labels if label == '180')
+    confidence = abs(upright - flipped) / len(labels)
+    if flipped > upright:
+        image = cv2.rotate(image, cv2.ROTATE_180)
+    return image, {'angle': 180 if flipped > upright else 0, 'confidence': round(confidence, 3)}
+
+
+def ocr_images(engine: PaddleOCR, images: List[np.ndarray],
+               cls: Union[bool, Sequence[bool]] = True,
+               timings: Optional[Dict[str, float]] = None,
+               boxes: bool = False) -> List[List[Tuple]]:
+    """
+    Run OCR over several images, sharing recognition batches across them
+
+    Detection runs per image, then the text crops of every image are
+    stacked into a single classifier/recognizer call so the recognizer
+    fills its batches with crops from different receipts.
+
+    Args:
+        engine: PaddleOCR instance
+        images: Grayscale or BGR image arrays
+        cls: Run the angle classifier on text crops, for every image or
+            per image
+        timings: Optional dict filled with milliseconds spent in
+            'detection', 'classification' and 'recognition'
+        boxes: Add each line's axis-aligned bounds [x0, y0, x1, y1]
+
+    Returns:
+        Per-image list of (text, confidence) tuples, or (text, confidence,
+        bounds) with boxes=True, in input order
+    """
+    if timings is None:
+        timings = {}
+    if isinstance(cls, bool):
+        cls = [cls] * len(images)
+    crops = []
+    counts = []
+    bounds = []
+    classify = []
+
+    started = time.perf_counter()
+    for image in images:
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+        dt_boxes, _ = engine.text_detector(image)
+        if dt_boxes is None or len(dt_boxes) == 0:
+            counts.append(0)
+            continue
+
+        dt_boxes = sorted_boxes(dt_boxes)
+        if cls[len(counts)]:
+            classify.extend(range(len(crops), len(crops) + len(dt_boxes)))
+        for box in dt_boxes:
+            crops.append(get_rotate_crop_image(image, copy.deepcopy(box)))
+            if boxes:
+                x, y = box[:, 0], box[:, 1]
+                bounds.append([float(x.min()), float(y.min()), float(x.max()), float(y.max())])
+        counts.append(len(dt_boxes))
+    timings['detection'] = _elapsed_ms(started)
+
+    if not crops:
+        return [[] for _ in images]
+
+    if classify and engine.use_angle_cls:
+        started = time.perf_counter()
+        turned, _, _ = engine.text_classifier([crops[index] for index in classify])
+        for index, crop in zip(classify, turned):
+            crops[index] = crop
+        timings['classification'] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    rec_res, _ = engine.text_recognizer(crops)
+    timings['recognition'] = _elapsed_ms(started)
+
+    results = []
+    offset = 0
+    for count in counts:
+        lines = [
+            (text, float(score), bounds[index]) if boxes else (text, float(score))
+            for index, (text, score) in enumerate(rec_res[offset:offset + count], offset)
+            if score >= engine.drop_score
+        ]
+        results.append(lines)
+        offset += count
+
+    logger.debug(f"Batched OCR: images={len(images)}, crops={len(crops)}")
+    return results
+
+
+def tesseract_images(images: List[np.ndarray],
+                     timings: Optional[Dict[str, float]] = None) -> List[List[Tuple]]:
+    """
+    Run Tesseract over several images
+
+    Tesseract binarizes, lays out and recognizes each image in a single
+    call, so the whole call is reported as 'recognition'. Words are joined
+    into Tesseract's text lines; a line's confidence is the mean of its
+    word confidences.
+
+    Args:
+        images: Grayscale image arrays, upright (inference._process
+            binarizes them first)
+        timings: Optional dict filled with milliseconds spent in
+            'recognition'
+
+    Returns:
+        Per-image list of (text, confidence, [x0, y0, x1, y1]) tuples in
+        reading order, like ocr_images(boxes=True)
+    """
+    import pytesseract
+
+    # One OpenMP thread per worker, like the PaddleOCR engines (read by the
+    # tesseract subprocess)
+    os.environ.setdefault("OMP_THREAD_LIMIT", str(CPU_THREADS))
+
+    if timings is None:
+        timings = {}
+    results = []
+
+    started = time.perf_counter()
+    for image in images:
+        data = pytesseract.image_to_data(image, lang=TESSERACT_LANG, config=TESSERACT_CONFIG,
+                                         output_type=pytesseract.Output.DICT)
+        lines = {}
+        for index, word in enumerate(data['text']):
+            confidence = float(data['conf'][index])
+            if confidence < 0 or not word.strip():
+                continue
+            key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+            left, top = data['left'][index], data['top'][index]
+            right, bottom = left + data['width'][index], top + data['height'][index]
+            if key not in lines:
+                lines[key] = ([], [], [left, top, right, bottom])
+            words, scores, bounds = lines[key]
+            words.append(word.strip())
+            scores.append(confidence / 100)
+            bounds[:] = [min(bounds[0], left), min(bounds[1], top),
+                         max(bounds[2], right), max(bounds[3], bottom)]
+
+        results.append([
+            (' '.join(words), sum(scores) / len(scores), [float(v) for v in bounds])
+            for words, scores, bounds in lines.values()
+        ])
+    timings['recognition'] = _elapsed_ms(started)
+
+    logger.debug(f"Tesseract OCR: images={len(images)}, lines={sum(map(len, results))}")
+    return results
+
+
+def _elapsed_ms(started: float) -> float:
+    """Milliseconds since a time.perf_counter() reading"""
+    return round((time.perf_counter() - started) * 1000, 2)
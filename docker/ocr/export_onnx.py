@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+ONNX Model Export
+Converts the baked PaddleOCR det/rec/cls models to ONNX and quantizes their
+weights to INT8 for the ONNX Runtime backend (OCR_BACKEND=onnx)
+
+Usage (at image build time, after the Paddle models are downloaded):
+    OCR_MODEL_DIR=/opt/paddleocr/models python export_onnx.py
+"""
+
+import logging
+import os
+import subprocess
+import sys
+
+from engine import MODEL_DIR, MODEL_KINDS, onnx_model_path
+
+logger = logging.getLogger(__name__)
+
+# ONNX opset; 11 is the lowest that covers every PP-OCR operator
+OPSET_VERSION = 11
+
+
+def export_model(kind: str):
+    """
+    Export one model and quantize it
+
+    Args:
+        kind: 'det', 'rec' or 'cls'
+
+    Raises:
+        subprocess.CalledProcessError: If paddle2onnx fails
+    """
+    # Imported here so the module can be read without onnxruntime installed
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = os.path.join(MODEL_DIR, kind)
+    float_path = os.path.join(model_dir, 'inference.onnx')
+
+    subprocess.run([
+        'paddle2onnx',
+        '--model_dir', model_dir,
+        '--model_filename', 'inference.pdmodel',
+        '--params_filename', 'inference.pdiparams',
+        '--save_file', float_path,
+        '--opset_version', str(OPSET_VERSION),
+        '--enable_onnx_checker', 'True',
+    ], check=True)
+
+    # Dynamic quantization: INT8 weights, activations quantized per batch at
+    # runtime, so no calibration set is needed
+    quantize_dynamic(float_path, onnx_model_path(kind), weight_type=QuantType.QUInt8)
+    os.remove(float_path)
+    logger.info(f"Exported {kind} model: {onnx_model_path(kind)}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    if not MODEL_DIR:
+        sys.exit("OCR_MODEL_DIR must point at the baked Paddle models")
+
+    for kind in MODEL_KINDS:
+        export_model(kind)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Receipt Field Extraction
+Collects candidates for every field from the joined OCR text (one marker
+scan for keywords, their amounts and currency symbols, one date pattern)
+and ranks them, driven by per-locale and per-vendor rule sets
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directory of *.json rule set files
+RULES_DIR = os.environ.get(
+    "OCR_RULES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules"))
+
+# Rule set used when a request does not pick one
+DEFAULT_RULES = os.environ.get("OCR_RULES", "en_US")
+
+# Minimum seconds between checks of the rules directory for changes
+RULES_RELOAD_SECONDS = float(os.environ.get("OCR_RULES_RELOAD_SECONDS", "5"))
+
+# Built-in rules every rule set file extends. Keywords and currency
+# markers are compiled into one literal alternation per rule set (see
+# RuleSet.markers).
+BASE_RULES = {
+    'date_order': 'mdy',
+    'currency': 'USD',
+    # Marker precedence when several currencies appear; alphabetic
+    # markers (ISO codes) must stand as whole words
+    'currency_symbols': {
+        '$': 'USD',
+        '£': 'GBP',
+        '€': 'EUR',
+        '¥': 'JPY',
+        '₹': 'INR',
+    },
+    'keywords': {
+        'total': ['total', 'amount due', 'balance'],
+        'subtotal': ['subtotal', 'sub total', 'sub-total'],
+        'tax': ['tax', 'vat', 'gst'],
+    },
+    'months': [
+        ['jan'], ['feb'], ['mar'], ['apr'], ['may'], ['jun'],
+        ['jul'], ['aug'], ['sep'], ['oct'], ['nov'], ['dec'],
+    ],
+}
+
+DATE_ORDERS = ('mdy', 'dmy')
+
+# Amounts always carry two decimals; '.' or ',' may be the decimal mark
+# and the other one (or an apostrophe) groups thousands
+AMOUNT = re.compile(r"(?:\d{1,3}(?:[.,']\d{3})+|\d+)[.,]\d{2}")
+AMOUNT_SEPARATORS = str.maketrans('', '', ".,'")
+
+# Amount opening a line (optionally behind a currency symbol)
+LEADING_AMOUNT = re.compile(r"[^\S\n]*[$£€¥₹₱]?[^\S\n]*((?:\d{1,3}(?:[.,']\d{3})+|\d+)[.,]\d{2})")
+
+# Numeric dates, matched against lowercased text. Word boundaries are
+# checked afterwards: a leading \b disables the regex prefix scan.
+NUMERIC_DATE = re.compile(r'(\d{1,4})[/.-](\d{1,2})[/.-](\d{2,4})')
+
+# Capitalized names near the top of the receipt
+MERCHANT = re.compile(r'^([A-Z][A-Za-z\s&]+)$')
+MERCHANT_SEARCH_LINES = 5
+
+
+class RuleSet:
+    """
+    Compiled extraction rules for one locale or vendor
+
+    Built from a rule set config (BASE_RULES merged with a rule file);
+    patterns are compiled once here and reused for every receipt.
+    """
+
+    def __init__(self, name: str, config: Dict):
+        self.name = name
+        self.date_order = config['date_order']
+        if self.date_order not in DATE_ORDERS:
+            raise ValueError(f"Rule set {name}: date_order must be one of {', '.join(DATE_ORDERS)}")
+
+        self.currency = config['currency']
+        self.currency_symbols = [
+            (symbol.lower(), code) for symbol, code in config['currency_symbols'].items()
+        ]
+        self.keywords = [
+            (word.lower(), field)
+            for field in ('total', 'tax')
+            for word in config['keywords'].get(field, [])
+        ]
+        self.subtotal_keywords = [word.lower() for word in config['keywords'].get('subtotal', [])]
+
+        # Every keyword and currency marker in one alternation, longest
+        # first so "subtotal" wins over "total" and "vat amount" over
+        # "vat". Branches that all open with a literal let the regex
+        # engine skip ahead by first character, so one finditer() is as
+        # cheap as a str.find per keyword; dates stay separate because a
+        # \d branch would disable that skip. Markers ending in a letter or
+        # digit must end a word. A lookahead captures the first amount
+        # after the marker on the same line without consuming it, so a
+        # keyword and its amount come out of the same match.
+        self.marker_kinds = {symbol: ('currency', code) for symbol, code in self.currency_symbols}
+        self.marker_kinds.update({word: ('subtotal', None) for word in self.subtotal_keywords})
+        self.marker_kinds.update({word: (field, None) for word, field in self.keywords})
+        branches = '|'.join(
+            re.escape(marker) + (r'(?![^\W_])' if marker[-1].isalnum() else '')
+            for marker in sorted(self.marker_kinds, key=len, reverse=True)
+        )
+        same_line_amount = rf"(?=[^\d\n]*(?:\d[^\n]*?)??({AMOUNT.pattern}))"
+        self.markers = re.compile(f"(?:{branches})(?:{same_line_amount})?")
+
+        months = config['months']
+        if len(months) != 12:
+            raise ValueError(f"Rule set {name}: months must list 12 entries")
+        self.month_numbers = {prefix.lower(): number for number, prefixes in enumerate(months, 1)
+                              for prefix in prefixes}
+        names = '|'.join(sorted(map(re.escape, self.month_numbers), key=len, reverse=True))
+        self.month_first = re.compile(r'(' + names + r')[^\W\d_]*\.?\s+(\d{1,2}),?\s+(\d{4})')
+        self.day_first = re.compile(r'(\d{1,2})\.?\s+(' + names + r')[^\W\d_]*\.?,?\s+(\d{4})')
+
+        # Vendor rule sets: lowercase markers looked for in the top lines
+        self.match = [marker.lower() for marker in config.get('match', [])]
+        self.merchant = config.get('merchant')
+
+    def __repr__(self):
+        return f"RuleSet({self.name!r})"
+
+
+# Used when extract() is called without a rule set
+BASE_RULESET = RuleSet('base', BASE_RULES)
+
+
+class RuleRegistry:
+    """
+    Rule sets loaded from a directory, reloaded when the files change
+
+    Each *.json file is one rule set named after the file. A file may
+    "extend" another rule set (BASE_RULES otherwise) and override any of
+    its keys; "keywords" are overridden per field. Rule sets with a
+    "match" list are vendor rules, applied automatically when one of the
+    markers appears near the top of the receipt.
+
+    The directory is re-checked at most every `reload_interval` seconds;
+    if a changed file fails to load, the previous rules stay in service.
+    The default rule set must exist at startup; if a reload drops it,
+    requests without a rule set fall back to BASE_RULES.
+    """
+
+    def __init__(self, directory: str = RULES_DIR, default: str = DEFAULT_RULES,
+                 reload_interval: float = RULES_RELOAD_SECONDS):
+        self.directory = directory
+        self.default = default
+        self.reload_interval = reload_interval
+        self._rules: Dict[str, RuleSet] = {'base': BASE_RULESET}
+        self._vendors: List[RuleSet] = []
+        self._signature = None
+        self._checked = 0.0
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.reload()
+        if default not in self._rules:
+            raise ValueError(f"Default rule set {default} not found in {directory}")
+
+    def reload(self) -> bool:
+        """
+        Reload the rule files if any was added, removed or modified
+
+        Returns:
+            True if new rules were loaded
+        """
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                files = sorted(glob.glob(os.path.join(self.directory, '*.json')))
+                signature = [(path, os.stat(path).st_mtime_ns) for path in files]
+                if signature == self._signature:
+                    return False
+                self._signature = signature
+                rules = self._load(files)
+            except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+                logger.error(f"Rule sets not reloaded, keeping previous: {str(e)}")
+                return False
+
+            self._rules = rules
+            self._vendors = [ruleset for ruleset in rules.values() if ruleset.match]
+            self._loaded_at = time.time()
+            logger.info(f"Rule sets loaded: {', '.join(sorted(rules))}")
+            if self.default not in rules:
+                logger.error(f"Default rule set {self.default} is gone, falling back to base rules")
+            return True
+
+    def _load(self, files: List[str]) -> Dict[str, RuleSet]:
+        """Read, resolve and compile every rule file"""
+        raw = {}
+        for path in files:
+            with open(path, encoding='utf-8') as handle:
+                raw[os.path.splitext(os.path.basename(path))[0]] = json.load(handle)
+
+        def resolve(name: str, seen: Tuple[str, ...] = ()) -> Dict:
+            if name == 'base':
+                return BASE_RULES
+            if name not in raw:
+                raise ValueError(f"Unknown rule set: {name}")
+            if name in seen:
+                raise ValueError(f"Rule set {name} extends itself")
+
+            config = raw[name]
+            parent = resolve(config.get('extends', 'base'), seen + (name,))
+            merged = {**parent, **config}
+            merged['keywords'] = {**parent['keywords'], **config.get('keywords', {})}
+            return merged
+
+        rules = {'base': BASE_RULESET}
+        for name in raw:
+            rules[name] = RuleSet(name, resolve(name))
+        return rules
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+
+    def names(self) -> List[str]:
+        """Names of the loaded rule sets"""
+        self._maybe_reload()
+        return sorted(self._rules)
+
+    def get(self, name: str) -> RuleSet:
+        """
+        Look up a rule set by name
+
+        Raises:
+            KeyError: If no rule set has that name
+        """
+        self._maybe_reload()
+        return self._rules[name]
+
+    def select(self, lines: List[str], name: Optional[str] = None) -> RuleSet:
+        """
+        Pick the rule set for a receipt
+
+        A vendor rule set whose marker appears in the top lines wins over
+        the requested locale, unless the request names a vendor itself.
+
+        Args:
+            lines: OCR text lines in reading order
+            name: Requested rule set (defaults to the registry default, or
+                BASE_RULES if a reload dropped it)
+
+        Returns:
+            The RuleSet to extract with
+
+        Raises:
+            KeyError: If the requested rule set does not exist
+        """
+        if name:
+            requested = self.get(name)
+        else:
+            self._maybe_reload()
+            requested = self._rules.get(self.default, BASE_RULESET)
+        if requested.match:
+            return requested
+
+        header = '\n'.join(lines[:MERCHANT_SEARCH_LINES]).lower()
+        for vendor in self._vendors:
+            if any(marker in header for marker in vendor.match):
+                return vendor
+        return requested
+
+    def stats(self) -> Dict:
+        """Loaded rule sets for health/monitoring endpoints"""
+        return {
+            "default": self.default,
+            "rule_sets": sorted(self._rules),
+            "vendors": [vendor.name for vendor in self._vendors],
+            "loaded_at": (datetime.utcfromtimestamp(self._loaded_at).isoformat()
+                          if self._loaded_at else None),
+        }
+
+
+def scan(lowered: str, rules: RuleSet = BASE_RULESET) -> Tuple[Dict[str, List], Dict[str, int]]:
+    """
+    Collect the keyword amounts and currency markers of the OCR text
+
+    One pass of the rule set's marker alternation finds every keyword
+    and currency marker in reading order, each keyword with the first
+    amount after it on the same line. If the line ends without one, the
+    amount opening the next line is used, since OCR often splits label
+    and value into separate boxes.
+
+    Args:
+        lowered: OCR text lines joined by newlines, lowercased
+        rules: Rule set to extract with
+
+    Returns:
+        (amounts, currencies): amounts maps 'total', 'subtotal' and 'tax'
+        to (amount text, amount offset, keyword offset) tuples in reading
+        order, the keyword offset set only when the amount is on the next
+        line; currencies maps ISO codes to their first marker's offset
+    """
+    amounts = {'total': [], 'subtotal': [], 'tax': []}
+    currencies = {}
+
+    for match in rules.markers.finditer(lowered):
+        start = match.start()
+        # Markers opening with a letter or digit must start a word
+        if start and lowered[start].isalnum() and lowered[start - 1].isalnum():
+            continue
+
+        field, code = rules.marker_kinds[match.group()]
+        if field == 'currency':
+            currencies.setdefault(code, start)
+        elif match.start(1) != -1:
+            amounts[field].append((match.group(1), match.start(1), None))
+        else:
+            line_end = lowered.find('\n', match.end())
+            following = LEADING_AMOUNT.match(lowered, line_end + 1) if line_end != -1 else None
+            if following:
+                amounts[field].append((following.group(1), following.start(1), start))
+
+    return amounts, currencies
+
+
+def _find_date(lowered: str, rules: RuleSet) -> Optional[Tuple[str, int]]:
+    """
+    Find the first valid date, numeric forms first
+
+    Returns:
+        (ISO YYYY-MM-DD date, offset in the text), or None
+    """
+    for match in NUMERIC_DATE.finditer(lowered):
+        if _is_word(lowered, match.start(), match.end()):
+            parsed = _numeric_date(*match.groups(), rules.date_order)
+            if parsed:
+                return parsed.isoformat(), match.start()
+
+    found = []
+    for pattern, groups in ((rules.month_first, (1, 2, 3)), (rules.day_first, (2, 1, 3))):
+        for match in pattern.finditer(lowered):
+            if _is_word(lowered, match.start(), match.end()):
+                month, day, year = (match.group(group) for group in groups)
+                parsed = _valid_date(int(year), rules.month_numbers[month], int(day))
+                if parsed:
+                    found.append((match.start(), parsed))
+                    break
+
+    if found:
+        offset, parsed = min(found)
+        return parsed.isoformat(), offset
+    return None
+
+
+def _numeric_date(first: str, second: str, third: str, order: str) -> Optional[date]:
+    """
+    Interpret a numeric date in the rule set's field order
+
+    Four-digit leading years are always year-month-day. When the first
+    field cannot be a month in an mdy locale (25/10/2025), or the second
+    cannot in a dmy locale, the other order is used instead.
+    """
+    if len(first) == 4:
+        return _valid_date(int(first), int(second), int(third)) if len(third) <= 2 else None
+    if len(first) == 3 or len(third) == 3:
+        return None
+
+    year = int(third) + 2000 if len(third) == 2 else int(third)
+    if order == 'dmy':
+        return (_valid_date(year, int(second), int(first))
+                or _valid_date(year, int(first), int(second)))
+    return (_valid_date(year, int(first), int(second))
+            or _valid_date(year, int(second), int(first)))
+
+
+def _valid_date(year: int, month: int, day: int) -> Optional[date]:
+    """Build a date, or None if the fields do not form one"""
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _is_word(text: str, start: int, end: int) -> bool:
+    """Whether text[start:end] is bounded by non-alphanumerics"""
+    return ((start == 0 or not text[start - 1].isalnum())
+            and (end == len(text) or not text[end].isalnum()))
+
+
+def extract(lines: List[str], confidences: Optional[List[float]] = None,
+            rules: RuleSet = BASE_RULESET) -> Tuple[Dict, Dict]:
+    """
+    Extract structured fields and the confidence of each chosen value
+
+    Ranking:
+    - total_amount: the last non-zero total keyword amount (falls back to
+      the last subtotal), so a subtotal never wins over the total
+    - tax_amount: the last tax keyword amount
+    - date: the first valid date
+    - merchant: the vendor rule set's merchant name (with the confidence
+      of the header line naming the vendor), else the first capitalized
+      name in the top lines
+    - currency: by the rule set's marker precedence, else its default
+
+    Args:
+        lines: OCR text lines in reading order
+        confidences: Per-line recognition confidence
+        rules: Rule set to extract with (see RuleRegistry.select)
+
+    Returns:
+        (fields, field_confidence) dicts keyed by field name
+    """
+    lowered = '\n'.join(lines).lower()
+    amounts, currencies = scan(lowered, rules)
+
+    def confidence(offset: int, label: Optional[int] = None) -> float:
+        # Confidence of the line holding `offset`; an amount read from the
+        # line after its keyword is only as good as the worse of the two
+        if not confidences:
+            return 1.0
+        value = confidences[lowered.count('\n', 0, offset)]
+        if label is not None:
+            value = min(value, confidences[lowered.count('\n', 0, label)])
+        return round(value, 3)
+
+    fields = {}
+    field_confidence = {}
+
+    totals = [total for total in amounts['total'] if _amount(total[0])] or amounts['subtotal']
+    if totals:
+        text, offset, label = totals[-1]
+        fields['total_amount'] = _amount(text)
+        field_confidence['total_amount'] = confidence(offset, label)
+
+    found_date = _find_date(lowered, rules)
+    if found_date:
+        fields['date'] = found_date[0]
+        field_confidence['date'] = confidence(found_date[1])
+
+    if rules.merchant:
+        # Vendor rules name the merchant; its confidence is that of the
+        # header line the vendor was recognized by
+        fields['merchant'] = rules.merchant
+        for index, line in enumerate(lines[:MERCHANT_SEARCH_LINES]):
+            if any(marker in line.lower() for marker in rules.match):
+                field_confidence['merchant'] = round(confidences[index], 3) if confidences else 1.0
+                break
+    else:
+        for index, line in enumerate(lines[:MERCHANT_SEARCH_LINES]):
+            match = MERCHANT.match(line.strip())
+            if match and len(match.group(1)) > 3:
+                fields['merchant'] = match.group(1)
+                field_confidence['merchant'] = round(confidences[index], 3) if confidences else 1.0
+                break
+
+    if amounts['tax']:
+        text, offset, label = amounts['tax'][-1]
+        fields['tax_amount'] = _amount(text)
+        field_confidence['tax_amount'] = confidence(offset, label)
+
+    for _, code in rules.currency_symbols:
+        if code in currencies:
+            fields['currency'] = code
+            field_confidence['currency'] = confidence(currencies[code])
+            break
+    else:
+        fields['currency'] = rules.currency
+
+    return fields, field_confidence
+
+
+def extract_fields(lines: List[str], confidences: Optional[List[float]] = None,
+                   rules: RuleSet = BASE_RULESET) -> Dict:
+    """
+    Extract structured fields from OCR lines
+
+    Args:
+        lines: OCR text lines in reading order
+        confidences: Per-line recognition confidence
+        rules: Rule set to extract with
+
+    Returns:
+        Dictionary of extracted fields
+    """
+    return extract(lines, confidences, rules)[0]
+
+
+def _amount(text: str) -> float:
+    """Parse a matched amount; the separator before the last two digits is the decimal mark"""
+    return int(text.translate(AMOUNT_SEPARATORS)) / 100
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+Inference Worker Pool
+Runs preprocessing and PaddleOCR in separate processes so the asyncio
+event loop stays free for I/O and health probes
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cascade import PADDLE, TESSERACT
+from documents import load_page
+
+logger = logging.getLogger(__name__)
+
+# Number of inference processes (each owns one PaddleOCR engine)
+INFERENCE_WORKERS = int(os.environ.get("OCR_INFERENCE_WORKERS", "2"))
+
+# Jobs allowed to wait for a free worker before requests are rejected
+INFERENCE_QUEUE_MAX = int(os.environ.get("OCR_INFERENCE_QUEUE_MAX", "8"))
+
+# Inference backend: "paddle" (Paddle Inference) or "onnx" (ONNX Runtime on
+# INT8-quantized exports of the same models, see export_onnx.py)
+BACKEND = os.environ.get("OCR_BACKEND", "paddle")
+
+# Identifies preprocessing + model behaviour in result cache keys; bump it
+# whenever a change would alter OCR output for the same image
+PIPELINE_VERSION = "ppocrv4-9" if BACKEND == "paddle" else f"ppocrv4-9-{BACKEND}-int8"
+
+# Preprocessing pipeline used when a request does not pick one
+DEFAULT_PIPELINE = os.environ.get("OCR_PIPELINE", "standard")
+
+# Load the models once in a fork server and fork workers from it, sharing
+# the weights copy-on-write, instead of spawning workers that each load
+# their own copy; lets more workers fit in the same memory limit.
+# Experimental and off by default: not yet measured on the real models
+SHARED_MODELS = os.environ.get("OCR_SHARED_MODELS", "0") == "1"
+
+# Run one synthetic receipt through each worker before it reports ready
+WARMUP = os.environ.get("OCR_WARMUP", "1") != "0"
+
+# Lines drawn on the warm-up image; short enough to stay cheap, but
+# enough to exercise detection, classification and recognition
+WARMUP_LINES = ('WARM UP STORE', '01/01/2025', 'TOTAL 12.34')
+
+# Engine owned by the current worker process
+_engine = None
+
+
+class PoolUnavailableError(Exception):
+    """Raised when the pool cannot run a job now; retry after `retry_after` seconds"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(PoolUnavailableError):
+    """Raised when the admission queue has no room for another job"""
+
+    status_code = 429
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue full, retry after {retry_after}s", retry_after)
+
+
+class WorkerCrashedError(PoolUnavailableError):
+    """Raised when a worker died under a job and the pool is being restarted"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference worker crashed, pool restarting, retry after {retry_after}s",
+                         retry_after)
+
+
+def _init_worker():
+    """
+    Process pool initializer: build this worker's PaddleOCR engine, or
+    adopt the fork server's shared one (see model_host)
+    """
+    global _engine
+
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    # Imported here so paddle is only loaded in worker processes
+    # The fork server's engine, if it preloaded model_host and judged the
+    # engine safe to share; otherwise this worker loads a private one
+    host = sys.modules.get("model_host") if SHARED_MODELS else None
+    if host is not None and host.engine is not None:
+        _engine = host.engine
+    else:
+        from engine import create_engine
+        _engine = create_engine(BACKEND)
+    if WARMUP:
+        _warm_up()
+    logger.info(f"Inference worker ready: pid={os.getpid()}, "
+                f"startup={time.perf_counter() - started:.1f}s")
+
+
+def _warm_up():
+    """
+    OCR a synthetic receipt so the first real job does not pay for
+    Paddle's lazy predictor setup and allocator growth
+    """
+    import cv2
+    import numpy as np
+
+    canvas = np.full((80 + 70 * len(WARMUP_LINES), 640), 255, np.uint8)
+    for row, text in enumerate(WARMUP_LINES):
+        cv2.putText(canvas, text, (30, 70 + 70 * row), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.3, 0, 2, cv2.LINE_AA)
+
+    result = _process([lambda: (canvas, canvas.shape[::-1], None)], DEFAULT_PIPELINE)[0]
+    if 'error' in result:
+        logger.warning(f"Warm-up inference failed: {result['error']}")
+
+
+def process_images(items: List[bytes], pipeline: str = DEFAULT_PIPELINE,
+                   pixel_budget: Optional[int] = None, split_tall: bool = False,
+                   engine: str = PADDLE) -> List[Dict]:
+    """
+    Decode, preprocess and OCR a list of images inside a worker process
+
+    Args:
+        items: Raw image bytes
+        pipeline: Preprocessing pipeline (see preprocess.PIPELINE_MODES)
+        pixel_budget: Most pixels per image after resizing (see
+            preprocess.resize_scale)
+        split_tall: Return tall images as strips instead of OCRing them
+            (see strips.should_split and process_strips)
+        engine: 'paddle', or 'tesseract' for the Tesseract first pass
+            (see cascade.py; binarized on every pipeline, never split
+            into strips)
+
+    Returns:
+        Per-image dict with either "lines" ((text, confidence) tuples) and
+        "preprocess" (stages run, per-stage timings including decode and
+        OCR, and the decoded image size), "strips" (strip jobs for
+        process_strips) and "preprocess", or "error", in input order
+    """
+    from preprocess import decode_image
+
+    return _process([lambda contents=contents: decode_image(contents) for contents in items],
+                    pipeline, pixel_budget, split_tall, engine)
+
+
+def process_strips(strips: List[Dict]) -> Dict:
+    """
+    OCR image strips inside a worker process
+
+    Args:
+        strips: Strip jobs from a process_images() result: "data" (raw
+            grayscale bytes), "shape" (height, width) and "cls" (whether
+            text crops need the angle classifier) each
+
+    Returns:
+        Dict with "lines", per strip (text, confidence, [x0, y0, x1, y1])
+        tuples in strip coordinates, and OCR "timings_ms"
+    """
+    import numpy as np
+
+    from engine import ocr_images
+
+    arrays = [np.frombuffer(strip["data"], np.uint8).reshape(strip["shape"]) for strip in strips]
+    timings = {}
+    lines = ocr_images(_engine, arrays, cls=[strip["cls"] for strip in strips],
+                       timings=timings, boxes=True)
+    return {"lines": lines, "timings_ms": timings}
+
+
+def process_page(contents: bytes, kind: str, index: int,
+                 pipeline: str = DEFAULT_PIPELINE,
+                 pixel_budget: Optional[int] = None) -> Dict:
+    """
+    Rasterize and OCR one page of a PDF/TIFF document inside a worker
+
+    Args:
+        contents: Raw document bytes
+        kind: 'pdf' or 'tiff' (see documents.document_kind)
+        index: Zero-based page index
+        pipeline: Preprocessing pipeline (see preprocess.PIPELINE_MODES)
+        pixel_budget: Most pixels of the page after resizing
+
+    Returns:
+        process_images()-style result with a 1-based "page" number
+    """
+    from preprocess import to_grayscale
+
+    def load():
+        page = load_page(contents, kind, index)
+        dpi = page.info.get('dpi')
+        return to_grayscale(page), page.size, float(dpi[0]) if dpi else None
+
+    result = _process([load], pipeline, pixel_budget)[0]
+    result["page"] = index + 1
+    return result
+
+
+def _process(loaders: List[Callable[[], Tuple[Any, Tuple[int, int], Optional[float]]]],
+             pipeline: str, pixel_budget: Optional[int] = None,
+             split_tall: bool = False, engine: str = PADDLE) -> List[Dict]:
+    """
+    Load, preprocess and OCR images, sharing recognition batches
+
+    Images stay NumPy arrays from decode to inference. Each page is
+    turned upright once (see engine.page_orientation); text crops are
+    classified line by line only when that decision is uncertain.
+
+    Args:
+        loaders: Callables returning (grayscale array, original
+            (width, height), DPI of the array or None) each; loader
+            errors are reported per image
+        pipeline: Preprocessing pipeline
+        pixel_budget: Most pixels per image after resizing
+        split_tall: Return tall images as strip jobs instead of OCRing
+            their strips here
+        engine: 'paddle' or 'tesseract'
+
+    Returns:
+        Per-image result dicts in input order
+    """
+    # Imported here so OpenCV/NumPy stay out of the API process
+    from engine import ORIENTATION_MIN_CONFIDENCE, ocr_images, page_orientation, tesseract_images
+    from preprocess import binarize, preprocess_array
+    from strips import merge_strips, plan_strips, should_split
+
+    results: List[Optional[Dict]] = [None] * len(loaders)
+    arrays = []
+    classify = []
+    jobs = []
+
+    for index, loader in enumerate(loaders):
+        try:
+            started = time.perf_counter()
+            gray, (width, height), dpi = loader()
+            decode_ms = round((time.perf_counter() - started) * 1000, 2)
+
+            report = {}
+            image = preprocess_array(gray, pipeline=pipeline, report=report,
+                                     dpi=dpi, pixel_budget=pixel_budget)
+            report['timings_ms']['decode'] = decode_ms
+            report['image'] = {'width': width, 'height': height}
+
+            started = time.perf_counter()
+            image, orientation = page_orientation(_engine, image)
+            report['timings_ms']['orientation'] = round((time.perf_counter() - started) * 1000, 2)
+            line_cls = engine == PADDLE and orientation['confidence'] < ORIENTATION_MIN_CONFIDENCE
+            report['orientation'] = {
+                'angle': (report['rotation']['angle'] + orientation['angle']) % 360,
+                'confidence': orientation['confidence'],
+                'line_classification': line_cls,
+            }
+
+            # Tall images are detected strip by strip (see strips.py);
+            # Tesseract lays out whole pages itself
+            spans = [(0, image.shape[0])]
+            if engine == PADDLE and should_split(*image.shape):
+                spans = plan_strips(image.shape[0])
+            if split_tall and len(spans) > 1:
+                # Strips are OCRed in parallel by the caller (see process_strips)
+                results[index] = {"strips": [
+                    {"top": top, "bottom": bottom, "shape": image[top:bottom].shape,
+                     "data": image[top:bottom].tobytes(), "cls": line_cls}
+                    for top, bottom in spans
+                ], "preprocess": report}
+                continue
+
+            # Tesseract always reads a binarized page, whichever stages
+            # the pipeline ran, so the cascade sees one confidence profile
+            if engine == TESSERACT and 'binarize' not in report['stages']:
+                started = time.perf_counter()
+                image = binarize(image)
+                report['stages'] = list(report['stages']) + ['binarize']
+                report['timings_ms']['binarize'] = round((time.perf_counter() - started) * 1000, 2)
+
+            arrays.extend(image[top:bottom] for top, bottom in spans)
+            classify.extend([line_cls] * len(spans))
+            jobs.append((index, spans, report))
+        except Exception as e:
+            results[index] = {"error": f"Invalid image: {str(e)}"}
+
+    if arrays:
+        ocr_timings = {}
+        if engine == TESSERACT:
+            batch_lines = tesseract_images(arrays, timings=ocr_timings)
+        else:
+            batch_lines = ocr_images(_engine, arrays, cls=classify, timings=ocr_timings, boxes=True)
+
+        offset = 0
+        for index, spans, report in jobs:
+            # OCR times cover the whole chunk since recognition is shared
+            report['timings_ms'].update(ocr_timings)
+            if len(spans) > 1:
+                report['strips'] = len(spans)
+            lines = merge_strips(spans, batch_lines[offset:offset + len(spans)])
+            offset += len(spans)
+            results[index] = {"lines": lines, "preprocess": report}
+
+    return results
+
+
+class InferencePool:
+    """
+    Bounded pool of inference processes
+
+    Admission is limited to one running job per worker plus `max_queue`
+    waiting jobs; anything beyond that is rejected with QueueFullError so
+    the caller can answer 429 instead of piling up requests. A worker that
+    dies under a job breaks the whole executor; the job fails with
+    WorkerCrashedError and the pool restarts itself (see restart).
+    """
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, max_queue: int = INFERENCE_QUEUE_MAX,
+                 initializer: Optional[Callable] = _init_worker):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.initializer = initializer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self.restarts = 0
+        self._pending = 0
+        self._avg_latency = 1.0  # seconds, exponentially weighted
+        self.warmed_up = False
+        self.warmup_seconds: Optional[float] = None
+
+    def start(self):
+        """Start the worker processes"""
+        if SHARED_MODELS:
+            # The fork server is a clean single-threaded process, so forking
+            # workers from it is safe where forking the API process is not
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["model_host"])
+        else:
+            context = multiprocessing.get_context("spawn")
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=self.initializer,
+        )
+        logger.info(f"Inference pool started: workers={self.workers}, max_queue={self.max_queue}, "
+                    f"backend={BACKEND}, shared_models={SHARED_MODELS}")
+
+    async def warm_up(self):
+        """
+        Wait until every worker process has loaded its engine and run its
+        warm-up inference, then mark the pool ready
+
+        Workers are spawned on demand, so one probe per worker is submitted
+        each round until as many distinct worker pids have answered.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        pids = set()
+        try:
+            while len(pids) < self.workers:
+                pids.update(await asyncio.gather(*[
+                    loop.run_in_executor(self._executor, os.getpid) for _ in range(self.workers)
+                ]))
+                if len(pids) < self.workers:
+                    await asyncio.sleep(0.2)
+        except Exception as e:
+            # Stay unready so the container health check fails and restarts us
+            logger.error(f"Inference pool warm-up failed: {str(e)}")
+            return
+
+        self.warmup_seconds = round(time.monotonic() - started, 2)
+        self.warmed_up = True
+        logger.info(f"Inference pool ready: workers={self.workers}, warm-up={self.warmup_seconds}s")
+
+    @property
+    def broken(self) -> bool:
+        """True when the executor is missing or a worker died and broke it"""
+        # Set by the executor's management thread as soon as a worker's
+        # process exits, whether or not a job was running on it
+        return self._executor is None or bool(getattr(self._executor, "_broken", False))
+
+    @property
+    def ready(self) -> bool:
+        """True when the workers are warmed up and the executor still works"""
+        return self.warmed_up and not self.broken
+
+    def recover(self):
+        """
+        Restart a broken executor that no failed job has restarted yet
+
+        A worker can die while idle, in which case no job sees the
+        breakage; the readiness probe calls this so the pool heals anyway.
+        A no-op while the pool works or a restart is still warming up.
+        """
+        if self._executor is None or not self.broken:
+            return
+        if self._warm_up_task and not self._warm_up_task.done():
+            return
+        self.restart(self._executor)
+
+    def restart(self, broken: ProcessPoolExecutor):
+        """
+        Replace an executor broken by a dying worker (OOM kill, segfault)
+
+        A ProcessPoolExecutor whose worker dies fails every later job, so
+        it is shut down and a fresh one started; the new workers warm up
+        in the background and the pool reports unready until they have.
+        Runs on the event loop without awaiting, so concurrent callers
+        holding the same broken executor restart it only once.
+
+        Args:
+            broken: The executor the failed job was submitted to
+        """
+        if broken is not self._executor:
+            return
+
+        self.warmed_up = False
+        self.restarts += 1
+        logger.error(f"Inference worker died, restarting pool (restart {self.restarts})")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+        self._warm_up_task = asyncio.get_running_loop().create_task(self.warm_up())
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self.warmed_up = False
+        if self._warm_up_task:
+            self._warm_up_task.cancel()
+            self._warm_up_task = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs currently running on a worker"""
+        return min(self._pending, self.workers)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs admitted but waiting for a free worker"""
+        return max(0, self._pending - self.workers)
+
+    def stats(self) -> Dict:
+        """Pool status for health/monitoring endpoints"""
+        return {
+            "ready": self.ready,
+            "workers": self.workers,
+            "backend": BACKEND,
+            "shared_models": SHARED_MODELS,
+            "restarts": self.restarts,
+            "in_flight": self.in_flight,
+            "queued": self.queue_depth,
+            "max_queue": self.max_queue,
+        }
+
+    def _retry_after(self) -> int:
+        """Estimated seconds until a queue slot frees up"""
+        waves = (self.queue_depth + 1) / self.workers
+        return max(1, math.ceil(waves * self._avg_latency))
+
+    async def run(self, fn: Callable, *args):
+        """
+        Run fn(*args) on a worker process
+
+        Raises:
+            QueueFullError: If the admission queue is full
+            WorkerCrashedError: If a worker died under the job
+        """
+        return (await self.map(fn, [args]))[0]
+
+    async def map(self, fn: Callable, arg_list: List[tuple]) -> List:
+        """
+        Run fn over several argument tuples in parallel across workers
+
+        All jobs are admitted together or not at all.
+
+        Raises:
+            QueueFullError: If the admission queue cannot hold every job
+            WorkerCrashedError: If a worker died under one of the jobs;
+                the pool restarts itself (see restart)
+        """
+        if self._pending + len(arg_list) > self.workers + self.max_queue:
+            raise QueueFullError(self._retry_after())
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        self._pending += len(arg_list)
+        started = time.monotonic()
+        try:
+            return await asyncio.gather(*[
+                loop.run_in_executor(executor, fn, *args) for args in arg_list
+            ])
+        except BrokenProcessPool:
+            self.restart(executor)
+            raise WorkerCrashedError(max(1, math.ceil(self.warmup_seconds or 10)))
+        finally:
+            self._pending -= len(arg_list)
+            elapsed = (time.monotonic() - started) / max(1, math.ceil(len(arg_list) / self.workers))
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * elapsed
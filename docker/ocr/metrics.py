@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Service Metrics
+Prometheus metrics for request rates and errors, per-stage latency,
+image sizes, inference queue depth and result cache effectiveness
+"""
+
+from typing import Dict, List, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Pipeline stages reported individually; the preprocessing steps of a
+# report (grayscale, resize, deskew, ...) are summed into "preprocess"
+OCR_STAGES = ('detection', 'classification', 'recognition')
+
+# Per-image stages run in the worker outside preprocessing
+IMAGE_STAGES = ('decode', 'orientation', 'preprocess')
+
+REQUESTS = Counter(
+    'ocr_requests_total', 'HTTP requests by endpoint and status code',
+    ['endpoint', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'ocr_request_duration_seconds', 'HTTP request latency until response headers',
+    ['endpoint'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+)
+IMAGE_ERRORS = Counter(
+    'ocr_image_errors_total', 'Images or pages that failed to decode or OCR'
+)
+STAGE_LATENCY = Histogram(
+    'ocr_stage_duration_seconds',
+    'Processing time per pipeline stage (OCR stages once per worker chunk)',
+    ['stage'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+CASCADE_RESULTS = Counter(
+    'ocr_cascade_results_total', 'First-pass results kept or escalated to the full pass',
+    ['engine', 'outcome']
+)
+IMAGE_BYTES = Histogram(
+    'ocr_upload_bytes', 'Size of uploaded images and documents',
+    buckets=(25e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6, 25e6)
+)
+IMAGE_MEGAPIXELS = Histogram(
+    'ocr_image_megapixels', 'Resolution of decoded images and rasterized pages',
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+)
+
+
+class ServiceCollector:
+    """
+    Scrape-time view of the inference pool and result cache
+
+    Both already keep their own counters, so they are read when
+    /metrics is scraped rather than mirrored on every request.
+    """
+
+    def __init__(self, pool, cache):
+        self.pool = pool
+        self.cache = cache
+
+    def collect(self):
+        pool = self.pool.stats()
+        yield GaugeMetricFamily('ocr_inference_ready', 'All workers warmed up (1) or not (0)',
+                                value=int(pool['ready']))
+        yield GaugeMetricFamily('ocr_inference_workers', 'Inference worker processes',
+                                value=pool['workers'])
+        yield GaugeMetricFamily('ocr_inference_in_flight', 'Jobs running on a worker',
+                                value=pool['in_flight'])
+        yield GaugeMetricFamily('ocr_inference_queue_depth', 'Jobs waiting for a worker',
+                                value=pool['queued'])
+        yield GaugeMetricFamily('ocr_inference_queue_max', 'Admission queue size',
+                                value=pool['max_queue'])
+
+        cache = self.cache.stats()
+        yield CounterMetricFamily('ocr_cache_hits', 'Result cache hits', value=cache['hits'])
+        yield CounterMetricFamily('ocr_cache_misses', 'Result cache misses', value=cache['misses'])
+        yield GaugeMetricFamily('ocr_cache_hit_ratio', 'Result cache hit ratio',
+                                value=cache['hit_ratio'])
+        yield GaugeMetricFamily('ocr_cache_memory_items', 'Entries in the memory tier',
+                                value=cache['memory_items'])
+        yield GaugeMetricFamily('ocr_cache_disk_bytes', 'Size of the disk tier',
+                                value=cache['disk_bytes'])
+
+
+def register_service(pool, cache):
+    """Expose the inference pool and result cache on /metrics"""
+    REGISTRY.register(ServiceCollector(pool, cache))
+
+
+def render():
+    """
+    Render the default registry
+
+    Returns:
+        (body, content type) for the /metrics response
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def stage_timings(report: Dict) -> Dict[str, float]:
+    """
+    Collapse an inference report's timings into pipeline stages
+
+    Args:
+        report: The "preprocess" report of a process_images() result
+
+    Returns:
+        Milliseconds for decode, orientation, preprocess and the OCR
+        stages present
+    """
+    timings = dict((report or {}).get('timings_ms', {}))
+    stages = {'decode': timings.pop('decode', 0.0),
+              'orientation': timings.pop('orientation', 0.0)}
+    ocr = {stage: timings.pop(stage) for stage in OCR_STAGES if stage in timings}
+    timings.pop('ocr', None)  # results cached before per-stage OCR timings
+    stages['preprocess'] = round(sum(timings.values()), 2)
+    stages.update(ocr)
+    return stages
+
+
+def observe_inference(results: List[Dict], totals: Optional[Dict[str, float]] = None):
+    """
+    Record stage latencies and image sizes for freshly OCRed results
+
+    Args:
+        results: process_images() results of one worker chunk (or one
+            process_page() result in a list); OCR stages are shared by
+            the chunk and recorded once
+        totals: Optional dict the stage milliseconds are added to
+    """
+    if totals is None:
+        totals = {}
+
+    chunk_stages = {}
+    for result in results:
+        if 'error' in result:
+            IMAGE_ERRORS.inc()
+            continue
+
+        report = result.get('preprocess') or {}
+        stages = stage_timings(report)
+        for stage in IMAGE_STAGES:
+            STAGE_LATENCY.labels(stage).observe(stages[stage] / 1000)
+            totals[stage] = totals.get(stage, 0.0) + stages[stage]
+        chunk_stages = {stage: stages[stage] for stage in OCR_STAGES if stage in stages}
+
+        image = report.get('image')
+        if image:
+            IMAGE_MEGAPIXELS.observe(image['width'] * image['height'] / 1e6)
+
+    for stage, ms in chunk_stages.items():
+        STAGE_LATENCY.labels(stage).observe(ms / 1000)
+        totals[stage] = totals.get(stage, 0.0) + ms
+
+
+def observe_first_pass(engine: str, result: Dict, escalated: bool,
+                       totals: Optional[Dict[str, float]] = None):
+    """
+    Record the outcome of a cascade first pass
+
+    A kept result is observed stage by stage like any other; the time of
+    an escalated one is recorded as a single "first_pass" stage so it does
+    not blur the stage latencies of the full pass that follows.
+
+    Args:
+        engine: First-pass engine name (see cascade.FIRST_PASS_ENGINES)
+        result: process_images() result of the first pass
+        escalated: Whether the receipt goes on to the full pass
+        totals: Optional dict the stage milliseconds are added to
+    """
+    if totals is None:
+        totals = {}
+    CASCADE_RESULTS.labels(engine, 'escalated' if escalated else 'kept').inc()
+    if not escalated:
+        observe_inference([result], totals)
+        return
+
+    ms = round(sum(stage_timings(result.get('preprocess')).values()), 2)
+    STAGE_LATENCY.labels('first_pass').observe(ms / 1000)
+    totals['first_pass'] = totals.get('first_pass', 0.0) + ms
+
+
+def observe_extraction(seconds: float):
+    """Record the time spent extracting fields from one result"""
+    STAGE_LATENCY.labels('extraction').observe(seconds)
+
+
+def timing_header(timings: Dict[str, float]) -> str:
+    """
+    Format stage timings for the X-Timing response header
+
+    Args:
+        timings: Milliseconds per stage
+
+    Returns:
+        e.g. "decode=3.1, preprocess=41.0, detection=180.2, total=412.9"
+    """
+    return ', '.join(f"{stage}={ms:.1f}" for stage, ms in timings.items())
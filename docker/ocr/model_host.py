@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Shared Model Host
+Preloaded by the multiprocessing fork server when OCR_SHARED_MODELS is on:
+builds the PaddleOCR engine once so every inference worker forked from the
+server shares its weights copy-on-write instead of loading its own copy
+"""
+
+import gc
+import logging
+import os
+
+from engine import create_engine
+from inference import BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+def thread_count() -> int:
+    """Threads of this process, native ones (OpenMP, oneDNN) included"""
+    try:
+        return len(os.listdir('/proc/self/task'))
+    except OSError:
+        return 1
+
+
+engine = create_engine(BACKEND)
+
+# A forked child gets only the forking thread; a lock held by any other
+# thread (an OpenMP or oneDNN pool started while loading) stays locked in
+# it forever. Share the engine only if loading left the server
+# single-threaded; otherwise workers build their own
+threads = thread_count()
+if threads > 1:
+    logger.error(f"Fork server runs {threads} threads after loading the models; "
+                 f"not sharing the engine, workers load their own")
+    engine = None
+
+# Move everything allocated so far out of the collector's reach; a GC pass
+# in a worker would otherwise write to (and un-share) every tracked object
+gc.freeze()
+
+if engine is not None:
+    logger.info("Shared OCR engine loaded in fork server")
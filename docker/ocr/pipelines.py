@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Preprocessing Pipeline Definitions
+Stage lists per pipeline and the per-image pixel cap, kept free of
+OpenCV/NumPy so the API process can validate and budget requests without
+loading the image stack
+"""
+
+import os
+
+# Hard cap on the pixels of one image after the resize stage; per-request
+# budgets are split from OCR_REQUEST_MEGAPIXELS and never exceed it
+MAX_IMAGE_PIXELS = int(float(os.environ.get("OCR_MAX_IMAGE_MEGAPIXELS", "4")) * 1_000_000)
+
+# Stages run by each fixed pipeline, in order
+PIPELINES = {
+    'fast': ('grayscale', 'rotate', 'resize'),
+    'standard': ('grayscale', 'crop', 'rotate', 'resize', 'denoise', 'deskew', 'binarize'),
+    'heavy': ('grayscale', 'crop', 'rotate', 'resize', 'contrast', 'denoise', 'deskew', 'binarize'),
+}
+PIPELINE_MODES = tuple(PIPELINES) + ('auto',)
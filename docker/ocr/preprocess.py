@@ -1,106 +1,783 @@
 #!/usr/bin/env python3
 """
 Image Preprocessing for OCR
-Implements deskew, denoise, and binarization for better OCR accuracy
+Implements receipt cropping, deskew, denoise, and binarization for better
+OCR accuracy
 """
 
+import io
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
 import cv2
 import numpy as np
 from PIL import Image
 
+from pipelines import MAX_IMAGE_PIXELS, PIPELINES, PIPELINE_MODES
+
+# Images wider than this are downscaled before preprocessing when neither
+# their text height nor their DPI can be determined
+MAX_WIDTH = 2000
+
+# Character (cap) height the resize stage aims for. PP-OCR recognizes text
+# lines resized to 48px high; detection boxes pad characters by about 1.6x,
+# so ~30px characters reach the recognizer without being resampled again.
+TARGET_TEXT_HEIGHT = float(os.environ.get("OCR_TARGET_TEXT_HEIGHT", "30"))
+
+# Upscaling beyond this adds pixels but no detail
+MAX_UPSCALE = 2.0
+
+# Scale changes smaller than this are not worth a resample
+RESIZE_TOLERANCE = 0.1
+
+# Embedded DPI below this is a camera default (72), not a scan resolution
+MIN_TRUSTED_DPI = 100
+
+# Pixel count of the proxy used to measure text height (sized by area so
+# narrow, very tall receipts keep legible characters), and the number of
+# character-sized blobs needed for a trustworthy measurement
+TEXT_ANALYSIS_PIXELS = 768 * 768
+MIN_TEXT_SAMPLES = 10
+
+# Characters whose nearest neighbour is measured to tell the text direction
+DIRECTION_SAMPLES = 400
+
+# Pages are only turned sideways above this direction confidence; a wrong
+# quarter turn cannot be undone by the later upside-down check
+DIRECTION_MIN_CONFIDENCE = float(os.environ.get("OCR_DIRECTION_MIN_CONFIDENCE", "0.5"))
+
+# Let libjpeg decode large JPEGs at reduced scale (see decode_image)
+DRAFT_DECODE = os.environ.get("OCR_DRAFT_DECODE", "1") != "0"
+
+EXIF_ORIENTATION = 0x0112
+
+# Longest side of the proxy used to measure image statistics
+ANALYSIS_SIZE = 512
+
+# `auto` thresholds (measured on the ANALYSIS_SIZE proxy)
+MIN_SKEW_ANGLE = 0.5        # degrees; smaller skews are left alone
+LOW_CONTRAST = 120.0        # 1st-99th percentile spread below which CLAHE helps
+NOISE_LEVEL = 6.0           # mean |image - median3(image)| above which to denoise
+BLUR_VARIANCE = 100.0       # Laplacian variance below which the image is blurry
+UNEVEN_LIGHTING = 12.0      # background brightness std-dev that needs binarization
+
+# Receipt boundary detection (fractions of the frame / quad area)
+MIN_CROP_AREA = 0.08        # smaller outlines are labels, logos or noise
+MAX_CROP_AREA = 0.85        # larger ones leave too little background to be worth a crop
+MIN_CROP_FILL = 0.85        # outline area / quad area; lower means not a quadrilateral
+MIN_CROP_CONTRAST = 25.0    # paper vs background brightness difference
+CROP_MARGIN = 0.01          # padding kept around the detected quad
+
+
+def decode_image(contents: bytes) -> Tuple[np.ndarray, Tuple[int, int], Optional[float]]:
+    """
+    Decode uploaded image bytes straight to an upright grayscale array
+
+    The bytes are handed to cv2.imdecode without an intermediate PIL or
+    RGB copy. JPEGs wider than MAX_WIDTH are decoded at 1/2, 1/4 or 1/8
+    scale by libjpeg (DCT scaling, like PIL's draft mode) as long as the
+    result stays at least MAX_WIDTH wide. EXIF orientation is applied.
+
+    Args:
+        contents: Raw image bytes
+
+    Returns:
+        (grayscale uint8 array, upright (width, height) of the original,
+        resolution of the decoded array in DPI if the file declares one)
 
-def preprocess_image(pil_image: Image.Image, target_dpi: int = 300) -> Image.Image:
+    Raises:
+        OSError: If the bytes are not a recognizable image
+    """
+    # Header only: format, size and EXIF, no pixel decoding
+    with Image.open(io.BytesIO(contents)) as probe:
+        image_format = probe.format
+        width, height = probe.size
+        orientation = probe.getexif().get(EXIF_ORIENTATION, 1)
+        dpi = probe.info.get('dpi')
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    flags = cv2.IMREAD_GRAYSCALE
+    if DRAFT_DECODE and image_format == 'JPEG':
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                                (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+            if width // factor >= MAX_WIDTH:
+                flags = reduced
+                break
+
+    gray = cv2.imdecode(np.frombuffer(contents, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gray is None:
+        # Formats OpenCV cannot read (e.g. GIF) go through PIL
+        with Image.open(io.BytesIO(contents)) as image:
+            gray = to_grayscale(image)
+
+    gray = apply_orientation(gray, orientation)
+    if dpi:
+        # Reduced decoding lowers the resolution by the same factor
+        dpi = float(dpi[0]) * gray.shape[1] / width
+    return gray, (width, height), dpi or None
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
     """
-    Preprocess image for optimal OCR results
+    Rotate/flip an array as its EXIF orientation tag says (1-8)
 
-    Steps:
-    1. Convert to grayscale
-    2. Resize to target DPI (300)
-    3. Denoise with bilateral filter
-    4. Deskew using Hough transform
-    5. Adaptive threshold binarization
+    Args:
+        image: Array as stored in the file
+        orientation: EXIF Orientation value; anything else is left as is
+
+    Returns:
+        Upright array
+    """
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.transpose(image)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.transpose(image), -1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+def to_grayscale(pil_image: Image.Image) -> np.ndarray:
+    """
+    Convert a PIL image to a grayscale array
+
+    Uses the same ITU-R 601 luma weights as cv2.COLOR_RGB2GRAY, without
+    materializing an RGB array first.
+    """
+    if pil_image.mode != 'L':
+        pil_image = pil_image.convert('L')
+    return np.asarray(pil_image)
+
+
+def preprocess_image(pil_image: Image.Image, target_dpi: int = 300,
+                     pipeline: str = 'standard',
+                     report: Optional[Dict] = None) -> Image.Image:
+    """
+    Preprocess a PIL image for optimal OCR results
+
+    Convenience wrapper around preprocess_array() for callers that hold
+    PIL images; the inference path decodes with decode_image() and stays
+    on arrays.
 
     Args:
         pil_image: PIL Image object
         target_dpi: Target DPI for OCR (default 300)
+        pipeline: One of PIPELINE_MODES
+        report: See preprocess_array()
 
     Returns:
         Preprocessed PIL Image
     """
-    # Convert PIL to OpenCV format
-    img_array = np.array(pil_image)
+    started = time.perf_counter()
+    gray = to_grayscale(pil_image)
+    grayscale_ms = _elapsed_ms(started)
+
+    dpi = pil_image.info.get('dpi')
+    image = preprocess_array(gray, target_dpi=target_dpi, pipeline=pipeline, report=report,
+                             dpi=float(dpi[0]) if dpi else None)
+    if report is not None:
+        report['timings_ms'] = {'grayscale': grayscale_ms, **report['timings_ms']}
+    return Image.fromarray(image)
+
+
+def preprocess_array(gray: np.ndarray, target_dpi: int = 300,
+                     pipeline: str = 'standard',
+                     report: Optional[Dict] = None,
+                     dpi: Optional[float] = None,
+                     pixel_budget: Optional[int] = None) -> np.ndarray:
+    """
+    Preprocess a grayscale image for optimal OCR results
+
+    Pipelines:
+    - fast: grayscale + sideways-page rotation + resize only (clean
+      digital receipts)
+    - standard: + receipt crop, bilateral denoise, deskew, adaptive
+      threshold
+    - heavy: standard + CLAHE contrast enhancement
+    - auto: measure cheap statistics on a downsampled copy and run only
+      the stages that would help (see analyze_image/select_stages)
+
+    The grayscale stage is done by the caller (decode_image() decodes
+    straight to grayscale); stages never modify `gray` in place. The
+    resize stage scales towards TARGET_TEXT_HEIGHT characters (see
+    resize_scale()) within the pixel budget.
+
+    Args:
+        gray: Grayscale uint8 array
+        target_dpi: Resolution to scale to when the text height cannot be
+            measured but the image declares its DPI
+        pipeline: One of PIPELINE_MODES
+        report: Optional dict filled with the stages run ('stages'),
+            per-stage milliseconds ('timings_ms'), the applied scale and
+            its basis ('resize'), the quarter turn applied ('rotation')
+            and, for auto, the measured statistics ('stats')
+        dpi: Resolution of `gray`, if known
+        pixel_budget: Most pixels the resized image may have (capped at
+            MAX_IMAGE_PIXELS)
 
-    # Convert to grayscale
-    if len(img_array.shape) == 3:
-        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    Returns:
+        Preprocessed grayscale array
+    """
+    if pipeline not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline: {pipeline}. Expected one of {PIPELINE_MODES}")
+
+    timings = {}
+
+    # Crop to the receipt first, so every later stage runs on fewer pixels
+    cropped = False
+    if pipeline == 'auto' or 'crop' in PIPELINES[pipeline]:
+        started = time.perf_counter()
+        quad = find_receipt(gray)
+        if quad is not None:
+            gray = crop_to_quad(gray, quad)
+            cropped = True
+        timings['crop'] = _elapsed_ms(started)
+
+    # Turn sideways pages before the text height is measured
+    started = time.perf_counter()
+    gray, rotation = rotate_sideways(gray)
+    timings['rotate'] = _elapsed_ms(started)
+
+    # Normalize resolution towards the recognizer's preferred text height
+    started = time.perf_counter()
+    resize = resize_scale(gray, target_dpi=target_dpi, dpi=dpi, pixel_budget=pixel_budget)
+    if resize['scale'] != 1.0:
+        height, width = gray.shape
+        gray = cv2.resize(
+            gray,
+            (max(1, round(width * resize['scale'])), max(1, round(height * resize['scale']))),
+            interpolation=cv2.INTER_AREA if resize['scale'] < 1 else cv2.INTER_CUBIC
+        )
+    timings['resize'] = _elapsed_ms(started)
+
+    if pipeline == 'auto':
+        started = time.perf_counter()
+        stats = analyze_image(gray)
+        stages = select_stages(stats)
+        if rotation['angle']:
+            stages.insert(1, 'rotate')
+        if cropped:
+            stages.insert(1, 'crop')
+        timings['analyze'] = _elapsed_ms(started)
     else:
-        gray = img_array
-
-    # Resize to target DPI if needed
-    height, width = gray.shape
-    if width > 2000:  # Downscale if too large
-        scale = 2000 / width
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        gray = cv2.resize(gray, (new_width, new_height), interpolation=cv2.INTER_AREA)
-
-    # Denoise
-    denoised = cv2.bilateralFilter(gray, 9, 75, 75)
-
-    # Deskew
-    deskewed = deskew_image(denoised)
-
-    # Adaptive threshold binarization
-    binary = cv2.adaptiveThreshold(
-        deskewed,
-        255,
-        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY,
-        11,
-        2
+        stats = {}
+        stages = list(PIPELINES[pipeline])
+
+    image = gray
+    for stage in stages:
+        if stage in ('grayscale', 'crop', 'rotate', 'resize'):
+            continue
+        started = time.perf_counter()
+        if stage == 'contrast':
+            image = enhance_contrast(image)
+        elif stage == 'denoise':
+            image = cv2.bilateralFilter(image, 9, 75, 75)
+        elif stage == 'deskew':
+            # auto already measured the skew on its analysis proxy
+            image = deskew_image(image, angle=stats.get('skew'))
+        elif stage == 'binarize':
+            image = binarize(image)
+        timings[stage] = _elapsed_ms(started)
+
+    if report is not None:
+        report['pipeline'] = pipeline
+        report['stages'] = stages
+        report['timings_ms'] = timings
+        report['resize'] = resize
+        report['rotation'] = rotation
+        if 'crop' in timings:
+            report['cropped'] = cropped
+        if stats:
+            report['stats'] = {name: round(value, 2) for name, value in stats.items()}
+
+    return image
+
+
+def resize_scale(gray: np.ndarray, target_dpi: int = 300, dpi: Optional[float] = None,
+                 pixel_budget: Optional[int] = None) -> Dict:
+    """
+    Pick the resize factor for an image
+
+    In order of preference the scale is derived from:
+    - text: the measured character height, scaled to TARGET_TEXT_HEIGHT
+    - dpi: a trustworthy declared resolution, scaled to target_dpi
+    - width: the MAX_WIDTH downscale (no upscaling)
+
+    The result is limited to MAX_UPSCALE and then to the pixel budget,
+    which always wins, so the cost of the later stages is bounded no
+    matter which camera took the photo.
+
+    Args:
+        gray: Grayscale image array
+        target_dpi: Resolution for the dpi basis
+        dpi: Resolution of `gray`, if known
+        pixel_budget: Most pixels after resizing (capped at MAX_IMAGE_PIXELS)
+
+    Returns:
+        Dict with 'scale' (1.0 = leave as is), 'basis' ('text', 'dpi' or
+        'width'), 'text_height' when measured and 'budget_limited'
+    """
+    height, width = gray.shape[:2]
+    text_height = estimate_text_height(gray)
+
+    if text_height:
+        scale, basis = TARGET_TEXT_HEIGHT / text_height, 'text'
+    elif dpi and dpi >= MIN_TRUSTED_DPI:
+        scale, basis = target_dpi / dpi, 'dpi'
+    else:
+        scale, basis = min(1.0, MAX_WIDTH / width), 'width'
+    scale = min(scale, MAX_UPSCALE)
+
+    budget = min(pixel_budget or MAX_IMAGE_PIXELS, MAX_IMAGE_PIXELS)
+    budget_limited = width * height * scale * scale > budget
+    if budget_limited:
+        scale = (budget / (width * height)) ** 0.5
+    elif abs(scale - 1.0) < RESIZE_TOLERANCE:
+        scale = 1.0
+
+    resize = {'scale': round(scale, 4), 'basis': basis, 'budget_limited': budget_limited}
+    if text_height:
+        resize['text_height'] = round(text_height, 1)
+    return resize
+
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """
+    Measure the typical character height of an image
+
+    Dark blobs are labelled on a TEXT_ANALYSIS_PIXELS proxy; blobs shaped
+    like characters (not lines, logos or specks) are kept and their upper
+    quartile height taken, which lands on capitals and digits rather than
+    lowercase letters or punctuation.
+
+    Args:
+        gray: Grayscale image array
+
+    Returns:
+        Character height in pixels of `gray`, or None with too few
+        character-like blobs to tell
+    """
+    proxy, stats, _ = _dark_blobs(gray)
+    scale = gray.shape[1] / proxy.shape[1]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+
+    characters = (
+        (heights >= 4)
+        & (heights <= 0.1 * min(proxy.shape))
+        & (widths <= 3 * heights)
+        & (areas >= 0.15 * heights * widths)
     )
+    if characters.sum() < MIN_TEXT_SAMPLES:
+        return None
+    return float(np.percentile(heights[characters], 75)) * scale
 
-    # Convert back to PIL
-    return Image.fromarray(binary)
 
+def text_direction(gray: np.ndarray) -> Tuple[bool, float]:
+    """
+    Tell whether text lines run across or down the page
 
-def deskew_image(image: np.ndarray, max_angle: float = 10.0) -> np.ndarray:
+    Docstrum-style: within a text line a character's nearest neighbour
+    is the next character, which is closer than the lines above and
+    below. So the direction to each character's nearest neighbour is
+    mostly horizontal on an upright or upside-down page, and mostly
+    vertical on a page turned by 90 or 270 degrees.
+
+    Args:
+        gray: Grayscale image array
+
+    Returns:
+        (sideways, confidence 0-1); (False, 0.0) with too little text
+    """
+    proxy, stats, centroids = _dark_blobs(gray)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    longest = np.maximum(heights, widths)
+
+    # Character-sized in either direction, since the page may be turned
+    characters = (
+        (longest >= 4)
+        & (longest <= 0.1 * min(proxy.shape))
+        & (longest <= 3 * np.minimum(heights, widths))
+        & (areas >= 0.15 * heights * widths)
+    )
+    points = centroids[1:][characters]
+    if len(points) < MIN_TEXT_SAMPLES:
+        return False, 0.0
+
+    # Nearest neighbour of a bounded sample of characters
+    points = points.astype(np.float32)
+    sample = points[::max(1, len(points) // DIRECTION_SAMPLES)]
+    offsets = sample[:, None, :] - points[None, :, :]
+    distances = np.hypot(offsets[..., 0], offsets[..., 1])
+    distances[distances == 0] = np.inf
+    nearest = offsets[np.arange(len(sample)), distances.argmin(axis=1)]
+
+    across = float(np.mean(np.abs(nearest[:, 0]) > np.abs(nearest[:, 1])))
+    return across < 0.5, abs(across - 0.5) * 2
+
+
+def rotate_sideways(gray: np.ndarray) -> Tuple[np.ndarray, Dict]:
     """
-    Deskew image using Hough line detection
+    Turn a page whose text runs down the page by 90 degrees clockwise
+
+    Afterwards the text is either upright or upside down; telling those
+    apart needs the angle classifier (see engine.page_orientation).
+    Pages whose direction is unclear (confidence below
+    DIRECTION_MIN_CONFIDENCE, e.g. photos with little legible text) are
+    left as they are.
 
     Args:
-        image: Grayscale image array
-        max_angle: Maximum rotation angle to consider (degrees)
+        gray: Grayscale image array
 
     Returns:
-        Deskewed image array
+        (image, rotation) where rotation holds the clockwise 'angle'
+        applied (0 or 90) and the direction 'confidence'
+    """
+    sideways, confidence = text_direction(gray)
+    sideways = sideways and confidence >= DIRECTION_MIN_CONFIDENCE
+    if sideways:
+        gray = cv2.rotate(gray, cv2.ROTATE_90_CLOCKWISE)
+    return gray, {'angle': 90 if sideways else 0, 'confidence': round(confidence, 3)}
+
+
+def text_line_rects(gray: np.ndarray, count: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Bounding rectangles of the longest horizontal text lines
+
+    Characters are smeared sideways into line blobs on a downsampled
+    proxy (as in estimate_skew) and the longest blobs are mapped back to
+    full resolution with a little padding.
+
+    Args:
+        gray: Grayscale image array with horizontal text
+        count: Most rectangles to return
+
+    Returns:
+        (x, y, width, height) rectangles in `gray` coordinates, longest first
+    """
+    proxy = downsample(gray)
+    scale = gray.shape[1] / proxy.shape[1]
+
+    _, binary = cv2.threshold(proxy, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, proxy.shape[1] // 40), 1))
+    blobs = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    rects = [
+        (x, y, w, h) for x, y, w, h in map(cv2.boundingRect, contours)
+        if w >= 4 * h and h >= 2 and h <= 0.1 * proxy.shape[0]
+    ]
+    rects.sort(key=lambda rect: rect[2], reverse=True)
+
+    lines = []
+    for x, y, w, h in rects[:count]:
+        pad = h * 0.3
+        left, top = max(0, int((x - pad) * scale)), max(0, int((y - pad) * scale))
+        right = min(gray.shape[1], int(np.ceil((x + w + pad) * scale)))
+        bottom = min(gray.shape[0], int(np.ceil((y + h + pad) * scale)))
+        lines.append((left, top, right - left, bottom - top))
+    return lines
+
+
+def _dark_blobs(gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Label dark connected components on a TEXT_ANALYSIS_PIXELS proxy
+
+    Returns:
+        (proxy, stats, centroids) as from cv2.connectedComponentsWithStats
+        (row 0 is the background)
+    """
+    height, width = gray.shape[:2]
+    shrink = min(1.0, (TEXT_ANALYSIS_PIXELS / (width * height)) ** 0.5)
+    proxy = downsample(gray, max(1, int(max(height, width) * shrink)))
+
+    _, binary = cv2.threshold(proxy, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    return proxy, stats, centroids
+
+
+def find_receipt(gray: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Find the outline of a receipt photographed against a background
+
+    Works on a downsampled proxy: the paper is separated from the darker
+    table with an Otsu threshold, text is closed into the paper, and the
+    largest bright region is fitted with a quadrilateral (a polygon
+    approximation of its convex hull, or its minimum-area rectangle when
+    part of the receipt runs out of frame).
+
+    Args:
+        gray: Grayscale image array
+
+    Returns:
+        4x2 float32 corners in full-resolution coordinates (top-left,
+        top-right, bottom-right, bottom-left), or None when no confident
+        outline is found and the full frame should be used
+    """
+    proxy = downsample(gray)
+    scale = gray.shape[1] / proxy.shape[1]
+    frame_area = proxy.shape[0] * proxy.shape[1]
+
+    blurred = cv2.GaussianBlur(proxy, (5, 5), 0)
+    threshold, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    contour = max(contours, key=cv2.contourArea)
+    area = cv2.contourArea(contour)
+    if not MIN_CROP_AREA <= area / frame_area <= MAX_CROP_AREA:
+        return None
+
+    hull = cv2.convexHull(contour)
+    quad = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+    if len(quad) != 4:
+        quad = cv2.boxPoints(cv2.minAreaRect(contour))
+    quad = quad.reshape(4, 2).astype(np.float32)
+
+    quad_area = cv2.contourArea(quad)
+    if not quad_area or area / quad_area < MIN_CROP_FILL:
+        return None
+
+    # The paper has to stand out from what surrounds it
+    inside = mask > 0
+    if float(blurred[inside].mean()) - float(blurred[~inside].mean()) < MIN_CROP_CONTRAST:
+        return None
+
+    return order_corners(quad) * scale
+
+
+def order_corners(points: np.ndarray) -> np.ndarray:
+    """
+    Order four points as top-left, top-right, bottom-right, bottom-left
+
+    Args:
+        points: 4x2 array of corner coordinates
+
+    Returns:
+        4x2 float32 array in clockwise order from the top-left
     """
-    # Edge detection
-    edges = cv2.Canny(image, 50, 150, apertureSize=3)
+    points = np.asarray(points, dtype=np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1)[:, 0]
+    return np.float32([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)],
+    ])
+
+
+def crop_to_quad(gray: np.ndarray, quad: np.ndarray, margin: float = CROP_MARGIN) -> np.ndarray:
+    """
+    Cut a quadrilateral out of an image and rectify it
+
+    Near-rectangular, axis-aligned outlines are sliced without
+    resampling; anything else is perspective-corrected into an upright
+    rectangle sized by the outline's longest edges.
 
-    # Hough line detection
-    lines = cv2.HoughLines(edges, 1, np.pi / 180, 200)
+    Args:
+        gray: Grayscale image array
+        quad: 4x2 corners from find_receipt()
+        margin: Padding around the quad as a fraction of its size
 
-    if lines is None:
-        return image  # No lines detected, return original
+    Returns:
+        Cropped grayscale array
+    """
+    tl, tr, br, bl = quad
+    width = max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))
+    height = max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))
+
+    # Push every corner outwards from the centre by the margin
+    center = quad.mean(axis=0)
+    padded = center + (quad - center) * (1 + 2 * margin)
+    padded[:, 0] = np.clip(padded[:, 0], 0, gray.shape[1] - 1)
+    padded[:, 1] = np.clip(padded[:, 1], 0, gray.shape[0] - 1)
+
+    left, top = padded.min(axis=0)
+    right, bottom = padded.max(axis=0)
+    tolerance = 0.02 * min(width, height)
+    box = np.float32([[left, top], [right, top], [right, bottom], [left, bottom]])
+    if np.abs(padded - box).max() <= tolerance:
+        return gray[int(top):int(np.ceil(bottom)) + 1, int(left):int(np.ceil(right)) + 1]
+
+    width = int(round(width * (1 + 2 * margin)))
+    height = int(round(height * (1 + 2 * margin)))
+    target = np.float32([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]])
+    matrix = cv2.getPerspectiveTransform(padded, target)
+    return cv2.warpPerspective(gray, matrix, (width, height),
+                               flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def analyze_image(gray: np.ndarray) -> Dict[str, float]:
+    """
+    Measure cheap quality statistics on a downsampled copy
+
+    Args:
+        gray: Grayscale image array
+
+    Returns:
+        Dict with blur_variance, contrast, noise, lighting and skew (degrees)
+    """
+    proxy = downsample(gray)
 
-    # Calculate dominant angle
-    angles = []
-    for rho, theta in lines[:, 0]:
-        angle = np.degrees(theta) - 90
-        if -max_angle <= angle <= max_angle:
-            angles.append(angle)
+    blur_variance = float(cv2.Laplacian(proxy, cv2.CV_64F).var())
+    low, high = np.percentile(proxy, (1, 99))
+    contrast = float(high - low)
+    noise = float(np.mean(cv2.absdiff(proxy, cv2.medianBlur(proxy, 3))))
 
-    if not angles:
+    # Background illumination: a max filter wipes out dark text strokes
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+    lighting = float(cv2.dilate(proxy, kernel).std())
+
+    return {
+        'blur_variance': blur_variance,
+        'contrast': contrast,
+        'noise': noise,
+        'lighting': lighting,
+        'skew': estimate_skew(proxy),
+    }
+
+
+def downsample(image: np.ndarray, max_side: int = ANALYSIS_SIZE) -> np.ndarray:
+    """
+    Shrink an image so its longest side is at most max_side
+
+    Args:
+        image: Image array
+        max_side: Longest side of the result in pixels
+
+    Returns:
+        Downsampled copy (or the input itself if already small enough)
+    """
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1.0:
         return image
+    return cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))),
+                      interpolation=cv2.INTER_AREA)
 
-    # Median angle
-    median_angle = np.median(angles)
+
+def select_stages(stats: Dict[str, float]) -> List[str]:
+    """
+    Pick the preprocessing stages worth running for an image
+
+    Args:
+        stats: Output of analyze_image()
+
+    Returns:
+        Ordered stage names (a subset of the heavy pipeline)
+    """
+    stages = ['grayscale', 'resize']
+    if stats['contrast'] < LOW_CONTRAST:
+        stages.append('contrast')
+    # Bilateral filtering further softens already-blurry images
+    if stats['noise'] > NOISE_LEVEL and stats['blur_variance'] >= BLUR_VARIANCE:
+        stages.append('denoise')
+    if abs(stats['skew']) >= MIN_SKEW_ANGLE:
+        stages.append('deskew')
+    if stats['lighting'] > UNEVEN_LIGHTING or stats['noise'] > NOISE_LEVEL:
+        stages.append('binarize')
+    return stages
+
+
+def estimate_skew(image: np.ndarray, max_angle: float = 10.0) -> float:
+    """
+    Estimate the dominant text skew angle from text-line blobs
+
+    Characters are smeared horizontally into line blobs and the angle of
+    each elongated blob's minimum-area rectangle is averaged, weighted by
+    blob length.
+
+    Args:
+        image: Grayscale image array (a downsampled copy is enough)
+        max_angle: Maximum rotation angle to consider (degrees)
+
+    Returns:
+        Correction angle in degrees for cv2.getRotationMatrix2D
+        (0.0 if no text lines were found)
+    """
+    _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, image.shape[1] // 25), 1))
+    blobs = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+    contours, _ = cv2.findContours(blobs, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return 0.0
+
+    rects = np.array([
+        (width, height, angle)
+        for _, (width, height), angle in map(cv2.minAreaRect, contours)
+    ], dtype=np.float64)
+    width, height, angle = rects[:, 0], rects[:, 1], rects[:, 2]
+
+    # Measure the angle of each blob's long side, folded into [-45, 45)
+    upright = width < height
+    length = np.where(upright, height, width)
+    thickness = np.where(upright, width, height)
+    angle = (np.where(upright, angle - 90, angle) + 45) % 90 - 45
+
+    lines = (
+        (length >= 4 * np.maximum(thickness, 1))
+        & (length >= 0.1 * image.shape[1])
+        & (np.abs(angle) <= max_angle)
+    )
+    if not lines.any():
+        return 0.0
+    return float(np.average(angle[lines], weights=length[lines]))
+
+
+def _elapsed_ms(started: float) -> float:
+    """Milliseconds since a perf_counter() timestamp"""
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def deskew_image(image: np.ndarray, max_angle: float = 10.0,
+                 angle: Optional[float] = None,
+                 min_angle: float = MIN_SKEW_ANGLE) -> np.ndarray:
+    """
+    Deskew image using text-line angles measured on a downsampled proxy
+
+    The skew is estimated on a copy no larger than ANALYSIS_SIZE (angles
+    are scale invariant), then a single rotation is applied at full
+    resolution. Skews below min_angle are left alone.
+
+    Args:
+        image: Grayscale image array
+        max_angle: Maximum rotation angle to consider (degrees)
+        angle: Pre-computed correction angle (skips estimation)
+        min_angle: Smallest correction worth a full-resolution rotation
+
+    Returns:
+        Deskewed image array
+    """
+    if angle is None:
+        angle = estimate_skew(downsample(image), max_angle=max_angle)
+
+    if abs(angle) < min_angle:
+        return image
 
     # Rotate image
     (h, w) = image.shape
     center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, median_angle, 1.0)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
     rotated = cv2.warpAffine(
         image,
         M,
@@ -130,6 +807,20 @@ def remove_borders(image: np.ndarray, border_percent: float = 0.02) -> np.ndarra
     return image[border_h:h-border_h, border_w:w-border_w]
 
 
+def binarize(image: np.ndarray) -> np.ndarray:
+    """
+    Adaptive threshold binarization
+
+    Args:
+        image: Grayscale image array
+
+    Returns:
+        Black-and-white image (0 or 255)
+    """
+    return cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, 11, 2)
+
+
 def enhance_contrast(image: np.ndarray) -> np.ndarray:
     """
     Enhance image contrast using CLAHE (Contrast Limited Adaptive Histogram Equalization)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Strip Tiling for Long Receipts
+Splits tall images into overlapping horizontal strips and merges the
+per-strip OCR lines back into one reading-order list. Pure Python, so the
+API process can plan and merge without loading OpenCV/NumPy
+"""
+
+import math
+import os
+from typing import List, Sequence, Tuple
+
+# Strip height after preprocessing. PaddleOCR scales detection input down
+# to det_limit_side_len (960) on its longest side, so a 6000px receipt
+# detected whole shrinks its text ~6x; 960px strips are detected at full
+# resolution.
+STRIP_HEIGHT = int(os.environ.get("OCR_STRIP_HEIGHT", "960"))
+
+# Rows shared by neighbouring strips; must exceed the tallest text line so
+# every line lies whole inside at least one strip
+STRIP_OVERLAP = int(os.environ.get("OCR_STRIP_OVERLAP", "128"))
+
+# Only images at least this many times taller than wide are split
+STRIP_MIN_ASPECT = float(os.environ.get("OCR_STRIP_MIN_ASPECT", "2.5"))
+
+
+def should_split(height: int, width: int) -> bool:
+    """Whether an image is tall enough to OCR in strips"""
+    return height > STRIP_HEIGHT + STRIP_OVERLAP and height >= STRIP_MIN_ASPECT * width
+
+
+def plan_strips(height: int, strip_height: int = STRIP_HEIGHT,
+                overlap: int = STRIP_OVERLAP) -> List[Tuple[int, int]]:
+    """
+    Row ranges of equally sized, overlapping strips covering an image
+
+    Args:
+        height: Image height in pixels
+        strip_height: Largest strip height
+        overlap: Rows shared by neighbouring strips
+
+    Returns:
+        (top, bottom) row ranges, top to bottom; neighbours share
+        `overlap` rows
+    """
+    if height <= strip_height:
+        return [(0, height)]
+
+    count = math.ceil((height - overlap) / (strip_height - overlap))
+    step = math.ceil((height - overlap) / count)
+    return [
+        (index * step, min(height, index * step + step + overlap))
+        for index in range(count)
+    ]
+
+
+def merge_strips(spans: Sequence[Tuple[int, int]], strip_lines: Sequence[List[Tuple]],
+                 overlap: int = STRIP_OVERLAP) -> List[Tuple[str, float]]:
+    """
+    Merge per-strip OCR lines into one list in reading order
+
+    Every strip owns the rows from the middle of its top overlap to the
+    middle of its bottom overlap, and keeps only the lines whose box
+    centre lies in those rows. A line inside an overlap is read by both
+    strips but kept once. A line cut by a strip edge has its partial box
+    centre beyond the middle of the overlap, so the neighbour that sees it
+    whole keeps it.
+
+    Args:
+        spans: plan_strips() row ranges
+        strip_lines: Per-strip (text, confidence, [x0, y0, x1, y1]) lines
+            in reading order, with coordinates relative to the strip
+        overlap: Overlap the spans were planned with
+
+    Returns:
+        (text, confidence) lines for the whole image
+    """
+    lines = []
+    last = len(spans) - 1
+    for index, ((top, bottom), found) in enumerate(zip(spans, strip_lines)):
+        owned_from = top + overlap / 2 if index > 0 else float('-inf')
+        owned_to = bottom - overlap / 2 if index < last else float('inf')
+        for text, confidence, (_, y0, _, y1) in found:
+            center = top + (y0 + y1) / 2
+            if owned_from <= center < owned_to:
+                lines.append((text, confidence))
+    return lines
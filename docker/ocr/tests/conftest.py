@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Make the service modules importable when pytest runs from anywhere"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Engine Cascade Tests
+Escalation decisions on first-pass results (see cascade.py)
+"""
+
+from cascade import escalation_reason
+from extraction import RuleRegistry, extract
+
+PETRON_LINES = [
+    "PETRON", "C5 LIBIS STATION", "25/07/2025 07:55", "XCS 40.12 L @ 62.30",
+    "VATable Sales 2,231.62", "12% VAT 267.79", "TOTAL AMOUNT DUE 2,499.41", "CASH 2,500.00",
+]
+
+
+def first_pass_response(lines, confidences, rules=None):
+    """The parts of an app.build_result() response escalation_reason reads"""
+    ruleset = RuleRegistry().select(lines, rules)
+    fields, field_confidence = extract(lines, confidences, ruleset)
+    return {
+        "confidence": sum(confidences) / len(confidences),
+        "extracted_fields": fields,
+        "field_confidence": field_confidence,
+        "line_count": len(lines),
+    }
+
+
+def test_vendor_receipt_is_kept():
+    response = first_pass_response(PETRON_LINES, [0.97] * len(PETRON_LINES))
+
+    assert response["extracted_fields"]["merchant"] == "PETRON"
+    assert response["field_confidence"]["merchant"] == 0.97
+    assert escalation_reason(response) is None
+
+
+def test_vendor_merchant_confidence_comes_from_header_line():
+    confidences = [0.6] + [0.97] * (len(PETRON_LINES) - 1)
+    response = first_pass_response(PETRON_LINES, confidences)
+
+    assert response["field_confidence"]["merchant"] == 0.6
+
+
+def test_requested_vendor_rules_without_marker_are_not_escalated_for_merchant():
+    lines = ["LIBIS STATION"] + PETRON_LINES[2:]
+    response = first_pass_response(lines, [0.97] * len(lines), rules="petron")
+
+    assert "merchant" not in response["field_confidence"]
+    assert escalation_reason(response) is None
+
+
+def test_low_field_confidence_escalates():
+    confidences = [0.97] * len(PETRON_LINES)
+    confidences[PETRON_LINES.index("TOTAL AMOUNT DUE 2,499.41")] = 0.5
+    response = first_pass_response(PETRON_LINES, confidences)
+
+    assert escalation_reason(response) == "field_confidence:total_amount"
+
+
+def test_empty_result_escalates():
+    assert escalation_reason({
+        "confidence": 0.0, "extracted_fields": {}, "field_confidence": {}, "line_count": 0,
+    }) == "no_text"
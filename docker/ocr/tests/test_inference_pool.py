@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Inference Pool Tests
+Recovery of the worker pool after a worker dies. Workers skip the OCR
+engine (initializer=None) so the tests run without PaddleOCR.
+"""
+
+import asyncio
+import os
+import signal
+
+import pytest
+
+from inference import InferencePool, WorkerCrashedError
+
+
+def test_pool_restarts_after_worker_dies():
+    async def scenario():
+        pool = InferencePool(workers=1, max_queue=2, initializer=None)
+        pool.start()
+        try:
+            await pool.warm_up()
+            assert pool.ready
+
+            with pytest.raises(WorkerCrashedError):
+                await pool.run(os._exit, 1)
+            assert not pool.ready
+            assert pool.restarts == 1
+
+            await pool._warm_up_task
+            assert pool.ready
+            assert await pool.run(os.getpid) > 0
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_idle_worker_death_makes_pool_unready():
+    async def scenario():
+        pool = InferencePool(workers=1, max_queue=2, initializer=None)
+        pool.start()
+        try:
+            await pool.warm_up()
+            pid = await pool.run(os.getpid)
+            os.kill(pid, signal.SIGKILL)
+
+            for _ in range(50):
+                if not pool.ready:
+                    break
+                await asyncio.sleep(0.1)
+            assert pool.broken
+            assert not pool.ready
+
+            pool.recover()
+            await pool._warm_up_task
+            assert pool.ready
+            assert await pool.run(os.getpid) != pid
+        finally:
+            pool.shutdown()
+
+    asyncio.run(scenario())
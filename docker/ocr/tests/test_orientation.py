@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Page Orientation Tests
+Sideways-page detection and rotation (see preprocess.rotate_sideways)
+"""
+
+import cv2
+import numpy as np
+
+from bench.synthetic import render_receipt
+from preprocess import rotate_sideways
+
+
+def receipt_gray(seed):
+    image, _ = render_receipt(seed=seed, width=700)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def test_sideways_receipt_is_turned():
+    gray = cv2.rotate(receipt_gray(3), cv2.ROTATE_90_COUNTERCLOCKWISE)
+    image, rotation = rotate_sideways(gray)
+
+    assert rotation['angle'] == 90
+    assert image.shape == gray.shape[::-1]
+
+
+def test_upright_receipt_is_left_alone():
+    gray = receipt_gray(3)
+    image, rotation = rotate_sideways(gray)
+
+    assert rotation['angle'] == 0
+    assert image is gray
+
+
+def test_unclear_direction_is_not_rotated():
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        noise = cv2.GaussianBlur(rng.integers(0, 255, (800, 600), dtype=np.uint8), (0, 0), 3)
+        image, rotation = rotate_sideways(noise)
+
+        assert rotation['angle'] == 0
+        assert rotation['confidence'] < 0.5
+        assert image is noise
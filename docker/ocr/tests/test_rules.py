@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Rule Registry Tests
+Default rule set checks at startup and across reloads
+"""
+
+import json
+
+import pytest
+
+from extraction import RuleRegistry
+
+LINES = ["CORNER SHOP", "07/25/2025", "TOTAL 12.50"]
+
+
+def write_rules(directory, name, config):
+    (directory / f"{name}.json").write_text(json.dumps(config), encoding="utf-8")
+
+
+def test_missing_default_fails_at_startup(tmp_path):
+    write_rules(tmp_path, "en_US", {})
+
+    with pytest.raises(ValueError):
+        RuleRegistry(str(tmp_path), default="en_XX")
+
+
+def test_default_dropped_by_reload_falls_back_to_base(tmp_path):
+    write_rules(tmp_path, "en_US", {})
+    registry = RuleRegistry(str(tmp_path), default="en_US", reload_interval=0)
+    assert registry.select(LINES).name == "en_US"
+
+    (tmp_path / "en_US.json").unlink()
+
+    assert registry.select(LINES).name == "base"
+
+
+def test_unknown_requested_rules_raise_key_error(tmp_path):
+    write_rules(tmp_path, "en_US", {})
+    registry = RuleRegistry(str(tmp_path), default="en_US")
+
+    with pytest.raises(KeyError):
+        registry.select(LINES, "en_XX")
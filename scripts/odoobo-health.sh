@@ -132,6 +132,24 @@ else
     echo -e "${YELLOW}⚠️  ${ODOO_ERRORS} errors${NC}"
 fi
 
+# OCR service latency and backlog (from its internal /metrics endpoint)
+OCR_METRICS=$(docker exec odoobo-ocr-service-1 python -c "import urllib.request; print(urllib.request.urlopen('http://localhost:8000/metrics', timeout=5).read().decode())" 2>/dev/null || echo "")
+if [ -n "$OCR_METRICS" ]; then
+    OCR_AVG_LATENCY=$(echo "$OCR_METRICS" | awk '
+        /^ocr_request_duration_seconds_sum\{endpoint="\/v1\/parse"\}/ {sum=$2}
+        /^ocr_request_duration_seconds_count\{endpoint="\/v1\/parse"\}/ {count=$2}
+        END {if (count > 0) printf "%.2f", sum / count; else print "0"}')
+    OCR_QUEUE=$(echo "$OCR_METRICS" | awk '/^ocr_inference_queue_depth / {printf "%d", $2}')
+    echo -n "  OCR /v1/parse mean latency: ${OCR_AVG_LATENCY}s, queue depth: ${OCR_QUEUE}... "
+    if awk "BEGIN {exit !(${OCR_AVG_LATENCY} < 5)}"; then
+        echo -e "${GREEN}✅${NC}"
+    else
+        echo -e "${YELLOW}⚠️  SLOW (SLA 5s)${NC}"
+    fi
+else
+    echo -e "  ${YELLOW}⚠️  OCR metrics unavailable${NC}"
+fi
+
 # PostgreSQL connectivity
 check "PostgreSQL connectivity" docker exec odoobo-db-1 psql -U odoo -d insightpulseai.net -c "SELECT 1"
 